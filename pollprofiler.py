@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+On-demand profiler for the poll cycles and command handlers of Polyglot v2 NodeServers
+by Goose66 (W. Randy King) kingwrandy@gmail.com
+"""
+
+import os
+import io
+import time
+import threading
+import logging
+
+_LOGGER = logging.getLogger()
+
+# Maximum time to wait for profiled sections still running when profiling stops (seconds)
+_STOP_WAIT_TIMEOUT = 30
+
+# Number of functions listed in the profile summary
+_SUMMARY_TOP_FUNCTIONS = 25
+
+# Categories of wall time in the profile summary - (category, file name suffix, function names)
+_SUMMARY_CATEGORIES = [
+    ("network", os.path.join("requests", "api.py"), ("request",)),
+    ("network", "ssdp.py", ("discover",)),
+    ("json", os.path.join("json", "__init__.py"), ("dumps", "loads")),
+    ("setDriver", "", ("setDriver",))
+]
+
+# profiler class
+class pollProfiler(object):
+    """Deterministic (cProfile) profiler that is switched on for a number of poll cycles at runtime.
+
+    Profiled sections are run through call(), which just calls the function when profiling is off.
+    Each thread gets its own profile, and the profiles are merged when profiling stops.
+
+    Parameters:
+    path -- folder to write the profile results to
+    logger -- logger to use
+    """
+
+    def __init__(self, path, logger=_LOGGER):
+
+        self.active = False
+        self.cyclesLeft = 0
+        self._path = path
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._local = threading.local()
+        self._profiles = []
+        self._started = 0.0
+        self._sectionTime = 0.0
+        self._sections = 0
+        self._skipped = 0
+        self._inFlight = 0
+        self._unfinished = 0
+
+    # start profiling for the specified number of poll cycles
+    def start(self, cycles):
+
+        import cProfile
+
+        with self._lock:
+            if self.active:
+                self._logger.warning("Profiling already active - %i cycle(s) left.", self.cyclesLeft)
+                return False
+
+            self._profileClass = cProfile.Profile
+            self._local = threading.local()
+            self._profiles = []
+            self._started = time.time()
+            self._sectionTime = 0.0
+            self._sections = 0
+            self._skipped = 0
+            self._unfinished = 0
+            self.cyclesLeft = cycles
+            self.active = True
+
+        self._logger.info("Profiling started for %i poll cycle(s).", cycles)
+        return True
+
+    # run a function, profiling it if profiling is active
+    def call(self, func, *args):
+
+        if not self.active:
+            return func(*args)
+
+        local = self._local
+
+        # nested sections are part of the outermost profiled section for the thread
+        if getattr(local, "depth", 0):
+            return func(*args)
+
+        # create a profile for the thread
+        profile = getattr(local, "profile", None)
+        if profile is None:
+            profile = self._profileClass()
+            local.profile = profile
+            with self._lock:
+                self._profiles.append(profile)
+
+        # count the section as in flight so that stopping waits for it (unless profiling just stopped)
+        with self._lock:
+            running = self.active
+            if running:
+                self._inFlight += 1
+        if not running:
+            return func(*args)
+
+        # only one profiler can be enabled at a time in some Python versions - run unprofiled if so
+        try:
+            profile.enable()
+        except ValueError:
+            with self._lock:
+                self._skipped += 1
+                self._endSection()
+            return func(*args)
+
+        local.depth = 1
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            local.depth = 0
+            with self._lock:
+                self._sectionTime += time.time() - start
+                self._sections += 1
+                self._endSection()
+
+    # count the end of an in flight section and wake a waiting stop() (must hold lock)
+    def _endSection(self):
+        self._inFlight -= 1
+        self._idle.notify_all()
+
+    # count a completed poll cycle, stopping when the requested number of cycles is done
+    def endCycle(self):
+
+        if not self.active:
+            return
+
+        with self._lock:
+            self.cyclesLeft -= 1
+            done = self.cyclesLeft <= 0
+
+        if done:
+            self.stop()
+
+    # stop profiling and write the results - returns the name of the summary file
+    def stop(self):
+
+        import pstats
+
+        # sections that are running when profiling stops are part of the profile, so wait for them to finish
+        # (except for the section of the calling thread, e.g. the stop command handler)
+        own = getattr(self._local, "depth", 0)
+        with self._lock:
+            if not self.active:
+                return None
+            self.active = False
+            self.cyclesLeft = 0
+            self._idle.wait_for(lambda: self._inFlight <= own, _STOP_WAIT_TIMEOUT)
+            self._unfinished = self._inFlight - own
+            profiles = self._profiles
+            self._profiles = []
+
+        # merge the profiles of all threads
+        stats = None
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+        if stats is None:
+            self._logger.warning("Profiling stopped - no profiled sections ran.")
+            return None
+
+        # write the raw stats and the summary to files
+        baseName = os.path.join(self._path, time.strftime("sonyavr-prof-%Y%m%d-%H%M%S"))
+        stats.dump_stats(baseName + ".prof")
+        with open(baseName + ".txt", "w") as f:
+            f.write(self._summary(stats))
+
+        self._logger.info("Profiling stopped - results written to %s.txt and %s.prof.", baseName, baseName)
+        return baseName + ".txt"
+
+    # build the text summary of the profile statistics
+    def _summary(self, stats):
+
+        # total cumulative time in each category
+        categories = {}
+        for (fileName, line, funcName), (cc, nc, tt, ct, callers) in stats.stats.items():
+            for category, suffix, funcNames in _SUMMARY_CATEGORIES:
+                if funcName in funcNames and fileName.endswith(suffix):
+                    categories[category] = categories.get(category, 0.0) + ct
+
+        lines = [
+            "Profiled %i section(s) over %.1f seconds (%i skipped)" % (self._sections, time.time() - self._started, self._skipped),
+            "Wall time in profiled sections: %.3f s" % self._sectionTime
+        ]
+        if self._unfinished:
+            lines.append("%i section(s) still running when profiling stopped - profiled so far, but not counted above" % self._unfinished)
+        for category in ("network", "json", "setDriver"):
+            lines.append("  %-10s %.3f s" % (category, categories.get(category, 0.0)))
+        lines.append("")
+
+        # top functions by cumulative time
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats("cumulative").print_stats(_SUMMARY_TOP_FUNCTIONS)
+        lines.append(stream.getvalue())
+
+        return "\n".join(lines)
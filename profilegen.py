@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Profile (nodedefs, editors, and NLS) generator for Polyglot v2 NodeServers
+by Goose66 (W. Randy King) kingwrandy@gmail.com
+"""
+
+import os
+import hashlib
+
+# Profile file names (relative to the profile folder)
+_NODEDEF_FILE = os.path.join("nodedef", "nodedefs.xml")
+_EDITOR_FILE = os.path.join("editor", "editors.xml")
+_NLS_FILE = os.path.join("nls", "en_US.txt")
+
+# build the nodedefs XML from the node classes
+def _build_nodedefs(nodeClasses):
+
+    lines = ["<nodeDefs>"]
+    for cls in nodeClasses:
+
+        profile = cls.profile
+        lines.append('  <nodeDef id="%s" nls="%s">' % (cls.id, profile["nls"]))
+        lines.append("    <editors />")
+
+        # status values for each driver in the order of the drivers list
+        lines.append("    <sts>")
+        for driver in cls.drivers:
+            editor, name = profile["sts"][driver["driver"]]
+            lines.append('      <st id="%s" editor="%s" />' % (driver["driver"], editor))
+        lines.append("    </sts>")
+
+        # accepted commands in the order of the commands dictionary
+        lines.append("    <cmds>")
+        lines.append("      <sends />")
+        lines.append("      <accepts>")
+        for cmd in cls.commands:
+            name, param = profile["cmds"][cmd]
+            if param is None:
+                lines.append('        <cmd id="%s" />' % cmd)
+            else:
+                editor, init = param
+                lines.append('        <cmd id="%s">' % cmd)
+                lines.append('          <p id="" editor="%s"%s />' % (editor, ' init="%s"' % init if init else ""))
+                lines.append("        </cmd>")
+        lines.append("      </accepts>")
+        lines.append("    </cmds>")
+        lines.append("  </nodeDef>")
+
+    lines.append("</nodeDefs>")
+    return "\n".join(lines) + "\n"
+
+# build the editors XML from the editor definitions
+def _build_editors(editors):
+
+    lines = ["<editors>"]
+    for editor in editors:
+
+        # range is either a subset of values or a min/max range, with optional precision and NLS labels
+        attrs = 'uom="%i"' % editor["uom"]
+        if "subset" in editor:
+            attrs += ' subset="%s"' % editor["subset"]
+        else:
+            attrs += ' min="%s" max="%s"' % (editor["min"], editor["max"])
+        if "prec" in editor:
+            attrs += ' prec="%i"' % editor["prec"]
+        if "nls" in editor:
+            attrs += ' nls="%s"' % editor["nls"]
+
+        lines.append('  <editor id="%s">' % editor["id"])
+        lines.append("    <!-- %s -->" % editor["comment"])
+        lines.append("    <range %s />" % attrs)
+        lines.append("  </editor>")
+
+    lines.append("</editors>")
+    return "\n".join(lines) + "\n"
+
+# build the NLS text from the node classes and index labels
+def _build_nls(nodeClasses, indexNames):
+
+    lines = []
+    for cls in nodeClasses:
+
+        profile = cls.profile
+        lines.append("ND-%s-NAME = %s" % (cls.id, profile["name"]))
+        lines.append("ND-%s-ICON = %s" % (cls.id, profile["icon"]))
+        for driver in cls.drivers:
+            editor, name = profile["sts"][driver["driver"]]
+            lines.append("ST-%s-%s-NAME = %s" % (profile["nls"], driver["driver"], name))
+        for cmd in cls.commands:
+            name, param = profile["cmds"][cmd]
+            lines.append("CMD-%s-%s-NAME = %s" % (profile["nls"], cmd, name))
+
+    # labels for index values
+    for prefix, labels in indexNames:
+        for index, label in labels:
+            lines.append("%s-%i = %s" % (prefix, index, label))
+
+    return "\n".join(lines) + "\n"
+
+# build the profile files
+def build_profile(nodeClasses, editors, indexNames):
+    """Builds the profile files from the node classes and editor and index label definitions
+
+    Parameters:
+    nodeClasses -- list of node classes, each with id, drivers, commands, and profile attributes
+    editors -- list of editor definitions (dictionaries of id, uom, comment, and subset or min/max, and optional prec and nls)
+    indexNames -- list of (NLS prefix, list of (index, label)) tuples for index values
+
+    Returns a dictionary of profile file contents keyed by file name relative to the profile folder
+    """
+
+    # make sure every driver and command of the node classes has a profile definition
+    for cls in nodeClasses:
+        for driver in cls.drivers:
+            if driver["driver"] not in cls.profile["sts"]:
+                raise ValueError("No profile definition for driver %s of node %s" % (driver["driver"], cls.id))
+        for cmd in cls.commands:
+            if cmd not in cls.profile["cmds"]:
+                raise ValueError("No profile definition for command %s of node %s" % (cmd, cls.id))
+
+    return {
+        _NODEDEF_FILE: _build_nodedefs(nodeClasses),
+        _EDITOR_FILE: _build_editors(editors),
+        _NLS_FILE: _build_nls(nodeClasses, indexNames)
+    }
+
+# compute the content hash of the profile files
+def profile_hash(files):
+    """Returns a hash of the contents of the profile files built by build_profile()"""
+
+    h = hashlib.sha1()
+    for name in sorted(files):
+        h.update(name.encode("utf-8"))
+        h.update(files[name].encode("utf-8"))
+
+    return h.hexdigest()
+
+# write the profile files
+def write_profile(files, path):
+    """Writes the profile files built by build_profile() to the profile folder
+
+    Parameters:
+    files -- dictionary of profile file contents from build_profile()
+    path -- path of the profile folder
+    """
+
+    for name, content in files.items():
+        fileName = os.path.join(path, name)
+        os.makedirs(os.path.dirname(fileName), exist_ok=True)
+        with open(fileName, "w") as f:
+            f.write(content)
@@ -3,32 +3,76 @@
 Polyglot v2 NodeServer for Sony Audio Control API devices (e.g. STR-DN1070 and STR-DN1080) 
 by Goose66 (W. Randy King) kingwrandy@gmail.com
 """
+import time
+_START_TIME = time.time() # for the startup timing report
+
 import sys
+import os
 import re
+import json
+import hashlib
+import threading
 import sonyapi
-import time
+import profilegen
+import pollprofiler
 import polyinterface
 
+_IMPORT_TIME = time.time() # for the startup timing report
+
 _ISY_PERCENT_UOM = 51 # Percentage from 0 to 100
 _ISY_INDEX_UOM = 25 # Index UOM for custom states (must match editor/NLS values in profile)
 _ISY_BOOL_UOM = 2 # Used for reporting status values for Controller node
-
-# A list of source input URIs in order of the corresponding Source (GV0) driver values
-_SOURCE_URIS = [
-    "extInput:source",      # IX_ZON_SRC-0 = Main
-    "extInput:bd-dvd",      # IX_ZON_SRC-1 = BD-DVD
-    "extInput:btAudio",     # IX_ZON_SRC-2 = Bluetooth
-    "extInput:game",        # IX_ZON_SRC-3 = Game
-    "extInput:hdmi",        # IX_ZON_SRC-4 = Front Panel HDMI
-    "extInput:line",        # IX_ZON_SRC-5 = Audio Line Input
-    "extInput:sacd-cd",     # IX_ZON_SRC-6 = SACD-CD
-    "extInput:sat-catv",    # IX_ZON_SRC-7 = SAT-CATV
-    "extInput:tv",          # IX_ZON_SRC-8 = TV
-    "extInput:video",       # IX_ZON_SRC-9 = Video
-    "dlna:music",           # IX_ZON_SRC-10 = DLNA
-    "storage:usb1",         # IX_ZON_SRC-11 = USB
-    "radio:fm"              # IX_ZON_SRC-12 = Radio
+_ISY_SECONDS_UOM = 58 # Duration in seconds
+_ISY_MSEC_UOM = 42 # Duration in milliseconds
+_ISY_RAW_UOM = 56 # Raw value (integer counts)
+
+# A list of source input URIs and names in order of the corresponding Source (GV0) driver values
+# (the names are the IX_ZON_SRC labels in the generated profile)
+_SOURCES = [
+    ("extInput:source", "Main"),
+    ("extInput:bd-dvd", "BD-DVD"),
+    ("extInput:btAudio", "Bluetooth"),
+    ("extInput:game", "Game"),
+    ("extInput:hdmi", "Front Panel HDMI"),
+    ("extInput:line", "Audio Line Input"),
+    ("extInput:sacd-cd", "SACD-CD"),
+    ("extInput:sat-catv", "SAT-CATV"),
+    ("extInput:tv", "TV"),
+    ("extInput:video", "Video"),
+    ("dlna:music", "DLNA"),
+    ("storage:usb1", "USB"),
+    ("radio:fm", "Radio")
+]
+_SOURCE_URIS = [uri for uri, name in _SOURCES]
+
+# Sources for which now playing metadata is retrieved for a zone
+_NOW_PLAYING_SOURCES = ("radio:fm", "dlna:music")
+
+# A list of playback states and names in order of the corresponding Play State (GV2) driver values
+_PLAY_STATES = [
+    ("", "N/A"),
+    ("STOPPED", "Stopped"),
+    ("PLAYING", "Playing"),
+    ("PAUSED", "Paused"),
+    ("FORWARDING", "Forwarding"),
+    ("REWINDING", "Rewinding")
 ]
+_PLAY_STATE_VALUES = [state for state, name in _PLAY_STATES]
+
+# A list of sound field values and names in order of the corresponding Sound Field (GV5) driver values
+_SOUND_FIELDS = [
+    ("", "N/A"),
+    ("2chStereo", "2ch Stereo"),
+    ("multiChStereo", "Multi Ch Stereo"),
+    ("direct", "Direct"),
+    ("dolbySurround", "Dolby Surround"),
+    ("neuralX", "Neural:X"),
+    ("frontSurround", "Front Surround"),
+    ("audioEnhancer", "Audio Enhancer"),
+    ("hdDcs", "HD-D.C.S."),
+    ("autoFormatDirect", "Auto Format Direct")
+]
+_SOUND_FIELD_VALUES = [value for value, name in _SOUND_FIELDS]
 
 _IX_AVR_ST_OFF = 0 
 _IX_AVR_ST_STANDBY = 1
@@ -37,9 +81,66 @@ _IX_AVR_ST_ON = 2
 _IX_ZON_ST_ACTIVE = 1
 _IX_ZON_ST_INACTIVE = 0
 
+# Editors for the generated profile
+_EDITORS = [
+    {"id": "CTR_LOGLEVEL", "uom": _ISY_INDEX_UOM, "subset": "0,10,20,30,40,50", "nls": "IX_CTR_LL", "comment": "ISY Index UOM with custom labels in NLS"},
+    {"id": "AVR_STATUS", "uom": _ISY_INDEX_UOM, "subset": "0-2", "nls": "IX_AVR_ST", "comment": "ISY Index UOM with custom labels in NLS"},
+    {"id": "ZON_STATUS", "uom": _ISY_INDEX_UOM, "subset": "0-1", "nls": "IX_ZON_ST", "comment": "ISY Index UOM with custom labels in NLS"},
+    {"id": "ZON_SOURCE", "uom": _ISY_INDEX_UOM, "subset": "0-%i" % (len(_SOURCES) - 1), "nls": "IX_ZON_SRC", "comment": "ISY Index UOM with custom labels in NLS"},
+    {"id": "ZON_VOLUME", "uom": _ISY_PERCENT_UOM, "subset": "0-100", "nls": "IX_ZON_VOL", "comment": "ISY Percent"},
+    {"id": "ZON_PLAYSTATE", "uom": _ISY_INDEX_UOM, "subset": "0-%i" % (len(_PLAY_STATES) - 1), "nls": "IX_ZON_PS", "comment": "ISY Index UOM with custom labels in NLS"},
+    {"id": "ZON_PRESET", "uom": _ISY_RAW_UOM, "min": 0, "max": 9999, "comment": "ISY Raw Value"},
+    {"id": "ZON_FREQ", "uom": _ISY_RAW_UOM, "min": 0, "max": 1000, "prec": 2, "comment": "ISY Raw Value (MHz)"},
+    {"id": "ZON_DURATION", "uom": _ISY_SECONDS_UOM, "min": 0, "max": 2147483647, "comment": "ISY Duration (seconds)"},
+    {"id": "AVR_SOUNDFIELD", "uom": _ISY_INDEX_UOM, "subset": "0-%i" % (len(_SOUND_FIELDS) - 1), "nls": "IX_AVR_SF", "comment": "ISY Index UOM with custom labels in NLS"},
+    {"id": "AVR_LEVEL", "uom": _ISY_RAW_UOM, "min": -20, "max": 20, "prec": 1, "comment": "ISY Raw Value (dB)"},
+    {"id": "CTR_CYCLES", "uom": _ISY_RAW_UOM, "min": 0, "max": 1000, "comment": "ISY Raw Value"},
+    {"id": "HLT_SECONDS", "uom": _ISY_SECONDS_UOM, "min": 0, "max": 2147483647, "comment": "ISY Duration (seconds)"},
+    {"id": "HLT_MSEC", "uom": _ISY_MSEC_UOM, "min": 0, "max": 2147483647, "comment": "ISY Duration (milliseconds)"},
+    {"id": "HLT_COUNT", "uom": _ISY_RAW_UOM, "min": 0, "max": 2147483647, "comment": "ISY Raw Value"}
+]
+
+# Labels for index values in the generated profile
+_INDEX_NAMES = [
+    ("IX_CTR_LL", [(0, "Not Set"), (10, "Debug"), (20, "Info"), (30, "Warning"), (40, "Error"), (50, "Critical")]),
+    ("IX_AVR_ST", [(_IX_AVR_ST_OFF, "Off/Disconnected"), (_IX_AVR_ST_STANDBY, "Standby"), (_IX_AVR_ST_ON, "On")]),
+    ("IX_ZON_ST", [(_IX_ZON_ST_INACTIVE, "Off/Inactive"), (_IX_ZON_ST_ACTIVE, "Active")]),
+    ("IX_ZON_SRC", [(index, name) for index, (uri, name) in enumerate(_SOURCES)]),
+    ("IX_ZON_VOL", [(-1, "N/A")]),
+    ("IX_ZON_PS", [(index, name) for index, (state, name) in enumerate(_PLAY_STATES)]),
+    ("IX_AVR_SF", [(index, name) for index, (value, name) in enumerate(_SOUND_FIELDS)])
+]
+
+# location of the profile folder for the nodeserver
+_PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profile")
+
 # delay after calling API set command before calling get command (seconds)
 _DELAY_AFTER_ACTION = 0.400 
 
+# minimum interval between reports of the health drivers (seconds) - a change in failure level (none, some,
+# or at least the resolve threshold) is reported immediately
+_HEALTH_REPORT_INTERVAL = 60
+
+# number of consecutive connection failures before searching for a receiver at a new address,
+# and the minimum interval between searches (seconds)
+_RESOLVE_FAILURE_THRESHOLD = 3
+_RESOLVE_INTERVAL = 300
+
+# polling for receiver readiness after power on: initial and maximum delay between polls (exponential
+# backoff) and time limit (seconds), and the maximum number of commands held until the receiver is ready
+_READY_POLL_INITIAL = 0.25
+_READY_POLL_MAX = 4.0
+_READY_TIMEOUT = 30
+_HELD_COMMAND_LIMIT = 10
+
+# default number of poll cycles to profile when the number is not specified
+_PROFILE_DEFAULT_CYCLES = 10
+
+# time to live for cached sound settings (seconds), and delay for batching sound setting changes
+# into a single setSoundSettings call (seconds)
+_SOUND_SETTINGS_TTL = 300
+_SOUND_SETTINGS_BATCH_DELAY = 0.5
+
 _LOGGER = polyinterface.LOGGER
 
 # Node for an audio zone (Main, Zone 2, Zone 3, HDMI Zone, etc.)
@@ -48,6 +149,7 @@ class Zone(polyinterface.Node):
     id = "ZONE"
     hint = [0x01, 0x06, 0x01, 0x00] # Residential/Audio Visual/AV Control Point
     _zoneURI = ""
+    _nowPlayingHash = ""
     minVol = 0
     maxVol = 100
 
@@ -76,6 +178,10 @@ class Zone(polyinterface.Node):
         # Place the zone in active status
         if  self.parent.interface.setActiveTerminal(self._zoneURI, "active"):
             self.setDriver("ST", _IX_ZON_ST_ACTIVE, True)
+
+            # activating a zone powers up the receiver, so hold further commands until it is ready
+            if self.parent.powerStatus != "active":
+                self.parent.waitForReady()
         else:
             _LOGGER.warning("Call to setActiveTerminal() failed in DON command handler.")
 
@@ -162,11 +268,65 @@ class Zone(polyinterface.Node):
         else:
             _LOGGER.warning("Call to setAudioMute() failed in TOGGLE_MUTE command handler.")
 
+    # run command handlers through the profiler (if profiling is active), holding them while the receiver is powering up
+    def runCmd(self, command):
+        if self.parent.holdCommand(self, command):
+            return True
+        return self.controller.profiler.call(super(Zone, self).runCmd, command)
+
+    # update the now playing drivers from the content info for the zone from the receiver poll
+    def updateNowPlaying(self, content, forceReport=False):
+
+        # clear the now playing drivers for sources without now playing metadata
+        if content["uri"] not in _NOW_PLAYING_SOURCES:
+            if self._nowPlayingHash or forceReport:
+                self._nowPlayingHash = ""
+                self.setNowPlayingDrivers({"state": "", "preset": 0, "frequency": 0, "duration": 0}, forceReport)
+            return
+
+        # the content info for all outputs from the receiver poll has the now playing metadata for the zone
+        dispNum = str(content.get("dispNum", ""))
+
+        nowPlaying = {
+            "state": content.get("stateInfo", {}).get("state", ""),
+            "preset": int(dispNum) if dispNum.isdigit() else 0,
+            "frequency": round(content.get("broadcastFreq", 0) / 1000000, 2),
+            "duration": int(content.get("durationMsec", 0) / 1000),
+            "title": content.get("title", ""),
+            "artist": content.get("artist", ""),
+            "album": content.get("albumName", "")
+        }
+
+        # don't republish metadata identical to the last published metadata
+        nowPlayingHash = getFingerprint(nowPlaying)
+        if nowPlayingHash == self._nowPlayingHash and not forceReport:
+            return
+
+        self._nowPlayingHash = nowPlayingHash
+
+        # text metadata can't be reported in drivers, so log it
+        _LOGGER.info("Now playing on zone %s: %s", self.address, " - ".join(v for v in (nowPlaying["title"], nowPlaying["artist"], nowPlaying["album"]) if v))
+
+        self.setNowPlayingDrivers(nowPlaying, forceReport)
+
+    # set the now playing drivers from the now playing metadata
+    def setNowPlayingDrivers(self, nowPlaying, forceReport=False):
+
+        state = nowPlaying["state"]
+        self.setDriver("GV2", _PLAY_STATE_VALUES.index(state) if state in _PLAY_STATE_VALUES else 0, True, forceReport)
+        self.setDriver("GV3", nowPlaying["preset"], True, forceReport)
+        self.setDriver("GV4", nowPlaying["frequency"], True, forceReport)
+        self.setDriver("GV5", nowPlaying["duration"], True, forceReport)
+
     drivers = [
         {"driver": "ST", "value": _IX_ZON_ST_INACTIVE, "uom": _ISY_INDEX_UOM},
         {"driver": "GV0", "value": 0, "uom": _ISY_INDEX_UOM},
         {"driver": "SVOL", "value": 0, "uom": _ISY_PERCENT_UOM},
-        {"driver": "GV1", "value": 0, "uom": _ISY_BOOL_UOM}
+        {"driver": "GV1", "value": 0, "uom": _ISY_BOOL_UOM},
+        {"driver": "GV2", "value": 0, "uom": _ISY_INDEX_UOM},
+        {"driver": "GV3", "value": 0, "uom": _ISY_RAW_UOM},
+        {"driver": "GV4", "value": 0, "uom": _ISY_RAW_UOM},
+        {"driver": "GV5", "value": 0, "uom": _ISY_SECONDS_UOM}
     ]
     commands = {
         "DON": cmd_don,
@@ -177,6 +337,30 @@ class Zone(polyinterface.Node):
         "UNMUTE": cmd_unmute,
         "TOGGLE_MUTE": cmd_toggle_mute,
     }
+    profile = {
+        "nls": "ZON",
+        "name": "Audio Zone",
+        "icon": "Output",
+        "sts": {
+            "ST": ("ZON_STATUS", "Zone State"),
+            "GV0": ("ZON_SOURCE", "Source"),
+            "SVOL": ("ZON_VOLUME", "Volume Level"),
+            "GV1": ("_2_0", "Mute"),
+            "GV2": ("ZON_PLAYSTATE", "Play State"),
+            "GV3": ("ZON_PRESET", "Preset/Track"),
+            "GV4": ("ZON_FREQ", "Frequency (MHz)"),
+            "GV5": ("ZON_DURATION", "Track Duration")
+        },
+        "cmds": {
+            "DON": ("Turn On", None),
+            "DOF": ("Turn Off", None),
+            "SET_SRC": ("Set Source", ("ZON_SOURCE", "GV0")),
+            "SET_VOL": ("Set Volume", ("ZON_VOLUME", "SVOL")),
+            "MUTE": ("Mute", None),
+            "UNMUTE": ("Unmute", None),
+            "TOGGLE_MUTE": ("Toggle Mute", None)
+        }
+    }
 
     # static method to format address for Zone nodes
     @staticmethod
@@ -191,8 +375,22 @@ class Receiver(polyinterface.Node):
     interface = None
     _apiURL = ""
     _apiVer = ""
-
-    def __init__(self, controller, primary, addr, name, apiURL=None, apiVer=None):
+    _udn = ""
+    _descriptorHash = ""
+    _terminalsHash = ""
+    terminals = None
+    _lastResolve = 0.0
+    powerStatus = ""
+    _readyToken = None
+    _unheldCommands = ("DON", "DOF", "STANDBY", "QUERY_ALL") # power and query commands are not held while powering up
+    _soundSettingsTime = 0.0
+    _speakerSettingsTime = 0.0
+    _lastPoll = 0.0
+    _pollDuration = 0.0
+    _lastHealthReport = 0.0
+    _reportedFailureLevel = 0
+
+    def __init__(self, controller, primary, addr, name, apiURL=None, apiVer=None, udn=None):
         super(Receiver, self).__init__(controller, addr, addr, name) # send its own address as primary
 
         # make the receiver a primary node
@@ -201,20 +399,135 @@ class Receiver(polyinterface.Node):
         if apiURL is None:
     
             # retrieve instance variables from polyglot custom data
+            # Note: UDN not stored by previous versions, so defaults to the node address (last 6 digits of UDN)
             cData = controller.getCustomData(addr).split(";")
             self._apiURL = cData[0]
             self._apiVer = cData[1]
+            self._udn = cData[2] if len(cData) > 2 else addr
+            if len(cData) > 4:
+                self._descriptorHash = cData[3]
+                self._terminalsHash = cData[4]
 
         else:
             self._apiURL = apiURL
             self._apiVer = apiVer
+            self._udn = addr if udn is None else udn
 
             # store instance variables in polyglot custom data
-            cData = ";".join([self._apiURL, self._apiVer])
-            controller.addCustomData(addr, cData)
+            self._storeCustomData()
         
         # create an instance of the API object for the device at the specified based address
-        self.interface = sonyapi.deviceAPI(self._apiURL, self._apiVer, _LOGGER)          
+        self.interface = controller.createInterface(self._apiURL, self._apiVer)
+
+        # measure poll age from node creation until the first successful poll
+        self._lastPoll = time.time()
+
+        # serializes polls of the receiver
+        self._pollLock = threading.Lock()
+
+        # commands held while the receiver is powering up
+        self._readyLock = threading.Lock()
+        self._heldCommands = []
+
+        # sound setting changes waiting to be sent in a single call
+        self._soundLock = threading.Lock()
+        self._pendingSettings = {}
+        self._soundTimer = None
+
+    # store instance variables in polyglot custom data
+    def _storeCustomData(self):
+        cData = ";".join([self._apiURL, self._apiVer, self._udn, self._descriptorHash, self._terminalsHash])
+        self.controller.addCustomData(self.address, cData)
+
+    # check the discovery fingerprint of the receiver's descriptor - returns True if changed
+    def descriptorChanged(self, descriptorHash):
+        return descriptorHash != self._descriptorHash
+
+    # check the discovery fingerprints of the receiver - returns True if either has changed
+    def fingerprintChanged(self, descriptorHash, terminalsHash):
+        return descriptorHash != self._descriptorHash or terminalsHash != self._terminalsHash
+
+    # store the discovery fingerprints of the receiver's descriptor and terminal list
+    def setFingerprint(self, descriptorHash, terminalsHash):
+        self._descriptorHash = descriptorHash
+        self._terminalsHash = terminalsHash
+        self._storeCustomData()
+
+    # update the API endpoint for the receiver (e.g. from discovery) - returns True if changed
+    def updateEndpoint(self, apiURL, apiVer, udn):
+
+        if apiURL == self._apiURL and apiVer == self._apiVer and udn == self._udn:
+            return False
+
+        _LOGGER.info("Updating API endpoint for receiver %s from %s to %s.", self.address, self._apiURL, apiURL)
+
+        self._apiURL = apiURL
+        self._apiVer = apiVer
+        self._udn = udn
+        self.interface.setBaseURL(apiURL)
+        self._storeCustomData()
+
+        return True
+
+    # search for the receiver at a new address after repeated connection failures - returns True if the endpoint changed
+    def resolveEndpoint(self):
+
+        # only search after repeated failures and not more often than the resolve interval
+        if self.interface.consecutiveFailures < _RESOLVE_FAILURE_THRESHOLD or time.time() - self._lastResolve < _RESOLVE_INTERVAL:
+            return False
+
+        self._lastResolve = time.time()
+
+        _LOGGER.info("Receiver %s not responding at %s - searching for receiver...", self.address, self._apiURL)
+
+        # locate the device by UDN using SSDP
+        dev = sonyapi.locate_device(self._udn, logger=_LOGGER)
+        if dev is None or dev["apiURL"] == self._apiURL:
+            return False
+
+        # update the endpoint and save in polyglot custom data
+        self.updateEndpoint(dev["apiURL"], dev["apiVer"], dev["udn"])
+        self.controller.saveCustomData(self.controller._customData)
+
+        return True
+
+    # Turn on the receiver
+    def cmd_don(self, command):
+
+        _LOGGER.info("Turn on receiver in cmd_don: %s", str(command))
+
+        # Set the power status to active and hold commands until the receiver is ready
+        if self.interface.setPowerStatus("active"):
+            self.setDriver("ST", _IX_AVR_ST_ON, True)
+            self.waitForReady()
+        else:
+            _LOGGER.warning("Call to setPowerStatus() failed in DON command handler.")
+
+    # Turn off the receiver
+    def cmd_dof(self, command):
+
+        _LOGGER.info("Turn off receiver in cmd_dof: %s", str(command))
+
+        # Set the power status to off and drop any held commands
+        if self.interface.setPowerStatus("off"):
+            self.cancelReady()
+            self.powerStatus = "off"
+            self.setDriver("ST", _IX_AVR_ST_OFF, True)
+        else:
+            _LOGGER.warning("Call to setPowerStatus() failed in DOF command handler.")
+
+    # Put the receiver in standby
+    def cmd_standby(self, command):
+
+        _LOGGER.info("Put receiver in standby in cmd_standby: %s", str(command))
+
+        # Set the power status to standby and drop any held commands
+        if self.interface.setPowerStatus("standby"):
+            self.cancelReady()
+            self.powerStatus = "standby"
+            self.setDriver("ST", _IX_AVR_ST_STANDBY, True)
+        else:
+            _LOGGER.warning("Call to setPowerStatus() failed in STANDBY command handler.")
 
     # Mute all zones
     def cmd_mute_all(self, command):
@@ -227,7 +540,7 @@ class Receiver(polyinterface.Node):
             # Wait for some time before getting state to allow it to settle
             time.sleep(_DELAY_AFTER_ACTION)     
 
-            self.updateNodeStates()
+            self.updateNodeStates(fresh=True)
 
         else:
             _LOGGER.warning("Call to setAudioMute() failed in MUTE command handler.")
@@ -243,26 +556,221 @@ class Receiver(polyinterface.Node):
             # Wait for some time before getting state to allow it to settle
             time.sleep(_DELAY_AFTER_ACTION)     
 
-            self.updateNodeStates()
+            self.updateNodeStates(fresh=True)
 
         else:
             _LOGGER.warning("Call to setAudioMute() failed in UNMUTE command handler.")
 
+    # Set the sound field
+    def cmd_set_sound_field(self, command):
+
+        _LOGGER.info("Set sound field for receiver in cmd_set_sound_field: %s", str(command))
+
+        # retrieve the integer index for the command
+        value = int(command.get("value"))
+        if value > 0:
+            self.queueSoundSetting("soundField", _SOUND_FIELD_VALUES[value])
+
+    # Turn on night mode
+    def cmd_night_on(self, command):
+
+        _LOGGER.info("Turn on night mode for receiver in cmd_night_on: %s", str(command))
+
+        self.queueSoundSetting("nightMode", "on")
+
+    # Turn off night mode
+    def cmd_night_off(self, command):
+
+        _LOGGER.info("Turn off night mode for receiver in cmd_night_off: %s", str(command))
+
+        self.queueSoundSetting("nightMode", "off")
+
+    # Turn on pure direct
+    def cmd_pure_on(self, command):
+
+        _LOGGER.info("Turn on pure direct for receiver in cmd_pure_on: %s", str(command))
+
+        self.queueSoundSetting("pureDirect", "on")
+
+    # Turn off pure direct
+    def cmd_pure_off(self, command):
+
+        _LOGGER.info("Turn off pure direct for receiver in cmd_pure_off: %s", str(command))
+
+        self.queueSoundSetting("pureDirect", "off")
+
     # Update node states for this and child nodes
     def cmd_query(self, command):
 
         _LOGGER.info("Updating node states for receiver in cmd_query()...")
 
-        # Update the node states and force report of all driver values
-        self.updateNodeStates(True)
+        # Update the node states from the device (not any cached state) and force report of all driver values
+        self.updateNodeStates(True, True)
 
-     # update the state of all zones from the AVR
-    def updateNodeStates(self, forceReport=False):
+    # run command handlers through the profiler (if profiling is active), holding them while the receiver is powering up
+    def runCmd(self, command):
+        if command.get("cmd") not in self._unheldCommands and self.holdCommand(self, command):
+            return True
+        return self.controller.profiler.call(super(Receiver, self).runCmd, command)
+
+    # hold a command for the receiver or one of its zones while the receiver is powering up
+    # returns True if the command was held (or refused because too many commands are held)
+    def holdCommand(self, node, command):
+
+        with self._readyLock:
+            if self._readyToken is None:
+                return False
+            full = len(self._heldCommands) >= _HELD_COMMAND_LIMIT
+            if not full:
+                self._heldCommands.append((time.time(), node, command))
+
+        if full:
+            _LOGGER.warning("Receiver %s is powering up and %i commands are already held - refusing command %s for node %s.", self.address, _HELD_COMMAND_LIMIT, command.get("cmd"), node.address)
+        else:
+            _LOGGER.info("Receiver %s is powering up - holding command %s for node %s until ready.", self.address, command.get("cmd"), node.address)
+        return True
+
+    # start polling for the receiver to become ready, holding commands until it is
+    def waitForReady(self):
+
+        # each wait gets its own token, so a poll thread from a cancelled wait stops even if a new wait has started
+        with self._readyLock:
+            if self._readyToken is not None:
+                return
+            token = object()
+            self._readyToken = token
+
+        threading.Thread(target=self._pollReady, args=(token,), daemon=True).start()
+
+    # stop waiting for the receiver to become ready and drop any held commands
+    def cancelReady(self):
+
+        with self._readyLock:
+            self._readyToken = None
+            self._heldCommands.clear()
+
+    # poll the power status of the receiver with exponential backoff until it is active,
+    # and then run the held commands
+    def _pollReady(self, token):
+
+        start = time.time()
+        delay = _READY_POLL_INITIAL
+        ready = False
+
+        while self._readyToken is token and time.time() - start < _READY_TIMEOUT:
+
+            powerInfo = self.interface.getPowerStatus(fresh=True)
+            if powerInfo and powerInfo["status"] == "active":
+                ready = True
+                break
+
+            time.sleep(delay)
+            delay = min(delay * 2, _READY_POLL_MAX)
+
+        # release the held commands (unless the wait was cancelled)
+        with self._readyLock:
+            if self._readyToken is not token:
+                return
+            held = self._heldCommands
+            self._heldCommands = []
+            self._readyToken = None
+
+        if not ready:
+            _LOGGER.warning("Receiver %s not ready after %i seconds - dropping %i held command(s).", self.address, _READY_TIMEOUT, len(held))
+            return
+
+        _LOGGER.info("Receiver %s ready after %.2f seconds - running %i held command(s).", self.address, time.time() - start, len(held))
+
+        self.powerStatus = "active"
+        self.setDriver("ST", _IX_AVR_ST_ON, True)
+
+        for queued, node, command in held:
+            try:
+                node.runCmd(command)
+            except:
+                _LOGGER.error("Unexpected error running held command %s: %s", command.get("cmd"), sys.exc_info()[0], exc_info=True)
+
+    # queue a sound setting change to be sent with any other changes made within the batch delay
+    def queueSoundSetting(self, target, value):
+
+        with self._soundLock:
+            self._pendingSettings[target] = value
+            if self._soundTimer is None:
+                self._soundTimer = threading.Timer(_SOUND_SETTINGS_BATCH_DELAY, self._sendSoundSettings)
+                self._soundTimer.daemon = True
+                self._soundTimer.start()
+
+    # send the queued sound setting changes in a single call
+    def _sendSoundSettings(self):
+
+        with self._soundLock:
+            settings = self._pendingSettings
+            self._pendingSettings = {}
+            self._soundTimer = None
+
+        if self.interface.setSoundSettings(settings):
+            self.setSoundDrivers(settings)
+        else:
+            _LOGGER.warning("Call to setSoundSettings() failed for settings %s.", str(settings))
+
+        # invalidate the cached sound settings so they are read on the next poll
+        self._soundSettingsTime = 0.0
+
+    # update the sound and speaker settings from the API if the cached settings have expired
+    def updateSoundSettings(self, forceReport=False):
+
+        now = time.time()
+
+        # the sound and speaker settings are cached separately since not all models support both,
+        # and failed reads are cached too so that unsupported calls are not retried every poll
+        if forceReport or now - self._soundSettingsTime >= _SOUND_SETTINGS_TTL:
+            self._soundSettingsTime = now
+            soundInfo = self.interface.getSoundSettings()
+            if soundInfo:
+                self.setSoundDrivers({item["target"]: item["currentValue"] for item in soundInfo}, forceReport)
+
+        if forceReport or now - self._speakerSettingsTime >= _SOUND_SETTINGS_TTL:
+            self._speakerSettingsTime = now
+            speakerInfo = self.interface.getSpeakerSettings()
+            if speakerInfo:
+                self.setSoundDrivers({item["target"]: item["currentValue"] for item in speakerInfo}, forceReport)
+
+    # set the sound setting drivers from a dictionary of setting names and values
+    def setSoundDrivers(self, settings, forceReport=False):
+
+        if "soundField" in settings:
+            soundField = settings["soundField"]
+            self.setDriver("GV5", _SOUND_FIELD_VALUES.index(soundField) if soundField in _SOUND_FIELD_VALUES else 0, True, forceReport)
+        if "nightMode" in settings:
+            self.setDriver("GV6", int(settings["nightMode"] == "on"), True, forceReport)
+        if "pureDirect" in settings:
+            self.setDriver("GV7", int(settings["pureDirect"] == "on"), True, forceReport)
+        if "subwooferLevel" in settings:
+            self.setDriver("GV8", float(settings["subwooferLevel"]), True, forceReport)
+        if "centerLevel" in settings:
+            self.setDriver("GV9", float(settings["centerLevel"]), True, forceReport)
+
+    # update the state of all zones from the AVR - serialized, since background discovery
+    # and command handlers may update the receiver while it is being polled
+    # fresh bypasses any cached device state (e.g. broker snapshots) for queries and updates after commands
+    def updateNodeStates(self, forceReport=False, fresh=False):
+        with self._pollLock:
+            self._updateNodeStates(forceReport, fresh)
+
+    # update the state of all zones from the AVR (must hold poll lock)
+    def _updateNodeStates(self, forceReport, fresh):
 
         _LOGGER.debug("Updating state for all nodes for receiver %s.", self.address)
+
+        start = time.time()
         
         # retrieve the power status of the AVR from the API
-        powerInfo = self.interface.getPowerStatus()
+        powerInfo = self.interface.getPowerStatus(fresh)
+
+        # If the receiver has stopped responding, check whether it has moved to a new address
+        if not powerInfo and self.resolveEndpoint():
+            fresh = True
+            powerInfo = self.interface.getPowerStatus(fresh)
         
         # If False returned, then timeout occurred (or some other error). Set the state to off/unknown
         # No need to continue if device is not responding
@@ -271,8 +779,16 @@ class Receiver(polyinterface.Node):
         
         else:
 
+            # the device responded, so record the time of the successful poll
+            self._lastPoll = time.time()
+
             # Set GV0 driver value based on return returned state
             state = powerInfo["status"] 
+            self.powerStatus = state
+
+            # hold commands while the receiver is powering up
+            if state == "activating":
+                self.waitForReady()
 
             if state == "active" or state == "activating":
                 self.setDriver("ST", _IX_AVR_ST_ON, True, forceReport)
@@ -280,13 +796,21 @@ class Receiver(polyinterface.Node):
                 self.setDriver("ST", _IX_AVR_ST_STANDBY, True, forceReport)
             else:
                 self.setDriver("ST", _IX_AVR_ST_OFF, True, forceReport)
+
+            # update the sound settings (cached, so only retrieved when expired or invalidated)
+            if state == "active":
+                self.updateSoundSettings(forceReport)
         
             # get the terminal (zone) list for the device from the API
-            terminals = self.interface.getCurrentExternalTerminalsStatus()
+            terminals = self.interface.getCurrentExternalTerminalsStatus(fresh)
+
+            # keep the terminal list for use in discovery
+            if terminals:
+                self.terminals = terminals
 
             # get the volume info and source info for all outputs
-            volumeInfo = self.interface.getVolumeInformation()
-            sourceInfo = self.interface.getPlayingContentInfo()
+            volumeInfo = self.interface.getVolumeInformation(fresh=fresh)
+            sourceInfo = self.interface.getPlayingContentInfo(fresh=fresh)
 
             # check that data was retrieved for all calls
             if terminals and volumeInfo and sourceInfo:
@@ -318,30 +842,114 @@ class Receiver(polyinterface.Node):
                             zone.setDriver("SVOL", int((vol - zone.minVol) / (zone.maxVol - zone.minVol) * 100), True, forceReport)
                             zone.setDriver("GV1", int(volume["mute"] == "on"), True, forceReport)
 
+                            # update the now playing metadata for the zone (only reported when it changes)
+                            zone.updateNowPlaying(source, forceReport)
+
+        self._pollDuration = time.time() - start
+
+        # update the health drivers for the receiver
+        self.updateHealthDrivers(forceReport)
+
+    # return the age (in seconds) of the last successful poll of the receiver
+    def pollAge(self):
+        return time.time() - self._lastPoll
+
+    # update the health drivers, throttled to limit the reports sent to the ISY
+    def updateHealthDrivers(self, forceReport=False):
+
+        failures = self.interface.consecutiveFailures
+
+        # report if forced, the failure level changed, or the report interval has elapsed
+        if forceReport or getFailureLevel(failures) != self._reportedFailureLevel or time.time() - self._lastHealthReport >= _HEALTH_REPORT_INTERVAL:
+
+            self._lastHealthReport = time.time()
+            self._reportedFailureLevel = getFailureLevel(failures)
+            self.setDriver("GV1", int(self.pollAge()), True, forceReport)
+            self.setDriver("GV2", int(self.interface.averageRoundTrip() * 1000), True, forceReport)
+            self.setDriver("GV3", failures, True, forceReport)
+            self.setDriver("GV4", int(self._pollDuration * 1000), True, forceReport)
+
     drivers = [
-        {"driver": "ST", "value": 0, "uom": _ISY_INDEX_UOM}
+        {"driver": "ST", "value": 0, "uom": _ISY_INDEX_UOM},
+        {"driver": "GV1", "value": 0, "uom": _ISY_SECONDS_UOM},
+        {"driver": "GV2", "value": 0, "uom": _ISY_MSEC_UOM},
+        {"driver": "GV3", "value": 0, "uom": _ISY_RAW_UOM},
+        {"driver": "GV4", "value": 0, "uom": _ISY_MSEC_UOM},
+        {"driver": "GV5", "value": 0, "uom": _ISY_INDEX_UOM},
+        {"driver": "GV6", "value": 0, "uom": _ISY_BOOL_UOM},
+        {"driver": "GV7", "value": 0, "uom": _ISY_BOOL_UOM},
+        {"driver": "GV8", "value": 0, "uom": _ISY_RAW_UOM},
+        {"driver": "GV9", "value": 0, "uom": _ISY_RAW_UOM}
     ]
     commands = {
+        "DON": cmd_don,
+        "DOF": cmd_dof,
+        "STANDBY": cmd_standby,
         "MUTE_ALL": cmd_mute_all,
         "UNMUTE_ALL": cmd_unmute_all,
+        "SET_SNDFLD": cmd_set_sound_field,
+        "NIGHT_ON": cmd_night_on,
+        "NIGHT_OFF": cmd_night_off,
+        "PURE_ON": cmd_pure_on,
+        "PURE_OFF": cmd_pure_off,
         "QUERY_ALL": cmd_query
     }
+    profile = {
+        "nls": "AVR",
+        "name": "Sony Audio Device",
+        "icon": "GenericRspCtl",
+        "sts": {
+            "ST": ("AVR_STATUS", "AVR Status"),
+            "GV1": ("HLT_SECONDS", "Last Poll Age"),
+            "GV2": ("HLT_MSEC", "Avg Response Time"),
+            "GV3": ("HLT_COUNT", "Consecutive Failures"),
+            "GV4": ("HLT_MSEC", "Poll Duration"),
+            "GV5": ("AVR_SOUNDFIELD", "Sound Field"),
+            "GV6": ("_2_0", "Night Mode"),
+            "GV7": ("_2_0", "Pure Direct"),
+            "GV8": ("AVR_LEVEL", "Subwoofer Level (dB)"),
+            "GV9": ("AVR_LEVEL", "Center Level (dB)")
+        },
+        "cmds": {
+            "DON": ("Turn On", None),
+            "DOF": ("Turn Off", None),
+            "STANDBY": ("Standby", None),
+            "MUTE_ALL": ("Mute All Zones", None),
+            "UNMUTE_ALL": ("Unmute All Zones", None),
+            "SET_SNDFLD": ("Set Sound Field", ("AVR_SOUNDFIELD", "GV5")),
+            "NIGHT_ON": ("Night Mode On", None),
+            "NIGHT_OFF": ("Night Mode Off", None),
+            "PURE_ON": ("Pure Direct On", None),
+            "PURE_OFF": ("Pure Direct Off", None),
+            "QUERY_ALL": ("Query", None)
+        }
+    }
 
 # Controller class (nodeserver only)
 class Controller(polyinterface.Controller):
 
     id = "CONTROLLER"
     _customData = {}
+    _brokerSocket = None
+    _pollDuration = 0.0
+    _lastHealthReport = 0.0
+    _reportedFailureLevel = 0
 
     def __init__(self, poly):
         super(Controller, self).__init__(poly)
         self.name = "SonyAVR NodeServer"
+        self._discoverLock = threading.Lock()
+
+        # profiler for poll cycles and command handlers - writes results to the nodeserver folder
+        self.profiler = pollprofiler.pollProfiler(os.path.dirname(os.path.abspath(__file__)), _LOGGER)
  
     # Start the nodeserver
     def start(self):
 
         _LOGGER.info("Started SonyAVR NodeServer...")
 
+        startTime = time.time()
+
         # remove all existing notices for the nodeserver
         self.removeNoticesAll()
 
@@ -352,6 +960,14 @@ class Controller(polyinterface.Controller):
         level = self.getCustomData("loggerlevel")
         if level is not None:
             _LOGGER.setLevel(int(level))
+
+        # If a broker socket is configured, then access receivers through the shared status broker
+        self._brokerSocket = self.polyConfig.get("customParams", {}).get("brokerSocket")
+        if self._brokerSocket:
+            _LOGGER.info("Using shared status broker at %s.", self._brokerSocket)
+
+        # install the profile if it has changed since last installed
+        self.updateProfile()
             
         # load nodes previously saved to the polyglot database
         # Note: has to be done in two passes to ensure Receiver (primary/parent) nodes exist
@@ -380,6 +996,17 @@ class Controller(polyinterface.Controller):
 
         # Update the node states for all receiver nodes and force report of all driver values
         self.updateNodeStates(True)
+        self.updateHealthDrivers(True)
+
+        # log the startup timing from process start to first driver report
+        now = time.time()
+        _LOGGER.info(
+            "Startup timing - imports: %.3f s, Polyglot connection: %.3f s, start to first driver report: %.3f s, total: %.3f s",
+            _IMPORT_TIME - _START_TIME,
+            startTime - _IMPORT_TIME,
+            now - startTime,
+            now - _START_TIME
+        )
 
         # nodeserver is being shutdown
     def stop(self):
@@ -394,16 +1021,77 @@ class Controller(polyinterface.Controller):
     def cmd_discover(self, command):
 
         _LOGGER.info("Discovering devices in cmd_discover()...")
-        
-        self.discover()
+
+        # only allow one discovery at a time
+        if not self._discoverLock.acquire(blocking=False):
+            _LOGGER.warning("Discovery already in progress - DISCOVER command ignored.")
+            return
+
+        # run discovery in the background so the command returns immediately
+        threading.Thread(target=self._runDiscover, daemon=True).start()
+
+    # run discovery and release the discovery lock when done
+    def _runDiscover(self):
+
+        try:
+            self.discover()
+        except:
+            _LOGGER.error("Unexpected error occurred in discovery: %s", sys.exc_info()[0], exc_info=True)
+        finally:
+            self._discoverLock.release()
 
     # Update the profile on the ISY
     def cmd_update_profile(self, command):
 
         _LOGGER.info("Installing profile in cmd_update_profile()...")
         
+        self.updateProfile(True)
+
+    # generate the profile and install it on the ISY if it changed (or if forced)
+    def updateProfile(self, force=False):
+
+        # build the profile files from the node classes and hash the contents
+        files = profilegen.build_profile([Controller, Receiver, Zone], _EDITORS, _INDEX_NAMES)
+        profileHash = profilegen.profile_hash(files)
+
+        if not force and profileHash == self.getCustomData("profilehash"):
+            _LOGGER.debug("Profile unchanged - skipping profile install.")
+            return
+
+        _LOGGER.info("Writing and installing profile (hash %s)...", profileHash)
+
+        # write the profile files to the profile folder and install the profile
+        profilegen.write_profile(files, _PROFILE_PATH)
         self.poly.installprofile()
+
+        # store the hash of the installed profile in custom data
+        self.addCustomData("profilehash", profileHash)
+        self.saveCustomData(self._customData)
         
+    # Start profiling poll cycles and command handlers
+    def cmd_start_profiling(self, command):
+
+        _LOGGER.info("Start profiling in cmd_start_profiling(): %s", str(command))
+
+        # retrieve the number of poll cycles to profile
+        value = command.get("value")
+        cycles = int(value) if value else _PROFILE_DEFAULT_CYCLES
+
+        if cycles > 0 and self.profiler.start(cycles):
+            self.setDriver("GV4", cycles)
+
+    # Stop profiling and write the results
+    def cmd_stop_profiling(self, command):
+
+        _LOGGER.info("Stop profiling in cmd_stop_profiling()...")
+
+        self.profiler.stop()
+        self.setDriver("GV4", 0)
+
+    # run command handlers through the profiler (if profiling is active)
+    def runCmd(self, command):
+        return self.profiler.call(super(Controller, self).runCmd, command)
+
     # Update the profile on the ISY
     def cmd_setLogLevel(self, command):
 
@@ -430,8 +1118,27 @@ class Controller(polyinterface.Controller):
     # called every shortPoll seconds (default 20)
     def shortPoll(self):
         
-        # update the driver values for all nodes
-        self.updateNodeStates()
+        # update the driver values for all nodes (profiled if profiling is active)
+        start = time.time()
+        self.profiler.call(self.updateNodeStates)
+        self._pollDuration = time.time() - start
+
+        # update the health drivers for the nodeserver
+        self.updateHealthDrivers()
+
+        # count the poll cycle if profiling and update the cycles left
+        if self.profiler.active:
+            self.profiler.endCycle()
+            self.setDriver("GV4", self.profiler.cyclesLeft)
+
+    # create the API interface for a receiver - through the shared status broker if configured
+    def createInterface(self, apiURL, apiVer):
+
+        if self._brokerSocket:
+            import sonybroker
+            return sonybroker.brokerAPI(self._brokerSocket, apiURL, apiVer, _LOGGER, int(self.polyConfig.get("shortPoll", 20)))
+        else:
+            return sonyapi.deviceAPI(apiURL, apiVer, _LOGGER)
 
     # helper method for storing custom data
     def addCustomData(self, key, data):
@@ -458,7 +1165,8 @@ class Controller(polyinterface.Controller):
         else:
             self.removeNotice("no_devices_notice")
  
-            # iterate the return devices
+            # iterate the return devices, tracking whether any custom data changed
+            changed = False
             for dev in devices:
 
                 _LOGGER.debug("Discovered device - addr: %s, name: %s", dev["id"], dev["name"])
@@ -473,55 +1181,76 @@ class Controller(polyinterface.Controller):
                         dev["id"],
                         getValidNodeName(dev["name"]),
                         dev["apiURL"],
-                        dev["apiVer"]
+                        dev["apiVer"],
+                        dev["udn"]
                     )
                     self.addNode(receiver)
+                    changed = True
 
                 else:
                     receiver = self.nodes[dev["id"]]
 
-                # use the interface for the receiver node to get a list of "terminals" (zones)
-                terminals = receiver.interface.getCurrentExternalTerminalsStatus()
+                    # update the endpoint for the receiver in case its address changed
+                    changed = receiver.updateEndpoint(dev["apiURL"], dev["apiVer"], dev["udn"]) or changed
+
+                descriptorHash = getFingerprint(dev)
+
+                # use the terminal list from the last poll of an unchanged receiver, otherwise use
+                # the interface for the receiver node to get a list of "terminals" (zones)
+                if receiver.terminals and not receiver.descriptorChanged(descriptorHash):
+                    terminals = receiver.terminals
+                else:
+                    terminals = receiver.interface.getCurrentExternalTerminalsStatus()
     
                 if not terminals:
                     _LOGGER.error("getCurrentExternalTerminalsStatus() for %s returned no data.", dev["name"])
 
                 else:
 
-                    # iterate terminals and create zone nodes
+                    # build the list of zones (address, uri, name) for the receiver
+                    zones = []
                     for terminal in terminals:
-
                         if terminal["meta"] == "meta:zone:output":
-
                             uri = terminal["uri"]
-                            addr = Zone.formatAddr(dev["id"], uri)
-                            name = terminal["title"]
-                            # active = terminal["active"]
-
-                            _LOGGER.debug("Discovered zone - addr: %s, name: %s", addr, name)
-
-                            # If no node already exists for the zone, then add a node for this zone
-                            if addr not in self.nodes:
-                            
-                                zone = Zone(
-                                    self,
-                                    receiver.address,
-                                    addr,
-                                    getValidNodeName(dev["model"] + " - " + name),
-                                    uri
-                                )
-                                self.addNode(zone)
+                            zones.append((Zone.formatAddr(dev["id"], uri), uri, terminal["title"]))
+
+                    terminalsHash = getFingerprint(zones)
+
+                    # skip receivers with unchanged descriptor and zones that already have all zone nodes
+                    if not receiver.fingerprintChanged(descriptorHash, terminalsHash) and all(addr in self.nodes for addr, uri, name in zones):
+                        _LOGGER.debug("Receiver %s unchanged - skipping.", dev["id"])
+                        continue
 
+                    # iterate zones and create zone nodes
+                    for addr, uri, name in zones:
+
+                        _LOGGER.debug("Discovered zone - addr: %s, name: %s", addr, name)
+
+                        # If no node already exists for the zone, then add a node for this zone
+                        if addr not in self.nodes:
+                        
+                            zone = Zone(
+                                self,
+                                receiver.address,
+                                addr,
+                                getValidNodeName(dev["model"] + " - " + name),
+                                uri
+                            )
+                            self.addNode(zone)
+
+                    receiver.setFingerprint(descriptorHash, terminalsHash)
                     receiver.updateNodeStates(True)
+                    changed = True
 
             # send custom data added by nodes to polyglot
-            self.saveCustomData(self._customData)
+            if changed:
+                self.saveCustomData(self._customData)
 
     # update the node states for all receiver and zone nodes
     def updateNodeStates(self, forceReport=False):
 
-        # iterate through the nodes of the nodeserver
-        for addr in self.nodes:
+        # iterate through the nodes of the nodeserver (copy of list since discovery may add nodes)
+        for addr in list(self.nodes):
         
             # ignore the controller node
             if addr != self.address:
@@ -531,14 +1260,59 @@ class Controller(polyinterface.Controller):
                 if node.id == "RECEIVER":
                     node.updateNodeStates(forceReport)
 
+    # update the health drivers summarizing all receivers, throttled to limit the reports sent to the ISY
+    def updateHealthDrivers(self, forceReport=False):
+
+        receivers = [node for node in list(self.nodes.values()) if node.id == "RECEIVER"]
+        failures = max((node.interface.consecutiveFailures for node in receivers), default=0)
+
+        # report if forced, the failure level changed, or the report interval has elapsed
+        if forceReport or getFailureLevel(failures) != self._reportedFailureLevel or time.time() - self._lastHealthReport >= _HEALTH_REPORT_INTERVAL:
+
+            self._lastHealthReport = time.time()
+            self._reportedFailureLevel = getFailureLevel(failures)
+            roundTrips = [node.interface.averageRoundTrip() for node in receivers]
+            self.setDriver("GV0", int(self._pollDuration * 1000), True, forceReport)
+            self.setDriver("GV1", int(max((node.pollAge() for node in receivers), default=0)), True, forceReport)
+            self.setDriver("GV2", int(sum(roundTrips) / len(roundTrips) * 1000) if roundTrips else 0, True, forceReport)
+            self.setDriver("GV3", failures, True, forceReport)
+
     drivers = [
         {"driver": "ST", "value": 0, "uom": _ISY_BOOL_UOM},
-        {"driver": "GV20", "value": 0, "uom": _ISY_INDEX_UOM}
+        {"driver": "GV20", "value": 0, "uom": _ISY_INDEX_UOM},
+        {"driver": "GV0", "value": 0, "uom": _ISY_MSEC_UOM},
+        {"driver": "GV1", "value": 0, "uom": _ISY_SECONDS_UOM},
+        {"driver": "GV2", "value": 0, "uom": _ISY_MSEC_UOM},
+        {"driver": "GV3", "value": 0, "uom": _ISY_RAW_UOM},
+        {"driver": "GV4", "value": 0, "uom": _ISY_RAW_UOM}
     ]
     commands = {
         "DISCOVER": cmd_discover,
         "UPDATE_PROFILE" : cmd_update_profile,
-        "SET_LOGLEVEL": cmd_setLogLevel
+        "SET_LOGLEVEL": cmd_setLogLevel,
+        "PROF_START": cmd_start_profiling,
+        "PROF_STOP": cmd_stop_profiling
+    }
+    profile = {
+        "nls": "CTR",
+        "name": "SonyAVR Nodeserver",
+        "icon": "Output",
+        "sts": {
+            "ST": ("_2_0", "NodeServer Online"),
+            "GV20": ("CTR_LOGLEVEL", "Logging Level"),
+            "GV0": ("HLT_MSEC", "Poll Cycle Duration"),
+            "GV1": ("HLT_SECONDS", "Oldest Poll Age"),
+            "GV2": ("HLT_MSEC", "Avg Response Time"),
+            "GV3": ("HLT_COUNT", "Max Consecutive Failures"),
+            "GV4": ("CTR_CYCLES", "Profiling Cycles Left")
+        },
+        "cmds": {
+            "DISCOVER": ("Discover Devices", None),
+            "UPDATE_PROFILE": ("Update Profile", None),
+            "SET_LOGLEVEL": ("Set Logging Level", ("CTR_LOGLEVEL", "GV20")),
+            "PROF_START": ("Start Profiling", ("CTR_CYCLES", None)),
+            "PROF_STOP": ("Stop Profiling", None)
+        }
     }
 
 # Removes invalid charaters and lowercase ISY Node address
@@ -550,6 +1324,15 @@ def getValidNodeAddress(s):
     # return lowercase address
     return addr[:14].lower()
 
+# Returns a short hash of JSON serializable data for detecting changes
+def getFingerprint(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+# Returns the level of a consecutive failure count for throttling health reports - 0 (none), 1 (some),
+# or 2 (at least the threshold for searching for the receiver at a new address)
+def getFailureLevel(failures):
+    return 0 if not failures else 1 if failures < _RESOLVE_FAILURE_THRESHOLD else 2
+
 # Removes invalid charaters for ISY Node description
 def getValidNodeName(s):
 
@@ -5,20 +5,27 @@ by Goose66 (W. Randy King) kingwrandy@gmail.com
 """
 
 import sys
+import time
+import math
+import threading
 import logging
 import requests
 import json
-import ssdp
-import xml.etree.ElementTree as ET
+import collections
+from types import SimpleNamespace
 
-# Pickup the root logger, and add a handler for module testing if none exists
+# Note: modules only needed for discovery (ssdp, xml.etree.ElementTree), traffic recording (gzip),
+# and the load generator are imported when first used to keep nodeserver startup fast
+
+# Pickup the root logger (a handler is added in the command line entry point for module testing)
 _LOGGER = logging.getLogger()
-if not _LOGGER.hasHandlers():
-    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s', level=logging.DEBUG)
 
 # Timeout durations for HTTP calls - defined here for easy tweaking
 _HTTP_POST_TIMEOUT = 3.05
 
+# Number of recent API round trip times used for the rolling average
+_RTT_SAMPLE_COUNT = 20
+
 # API Spec
 _SSDP_SEARCH_TARGET = "urn:schemas-sony-com:service:ScalarWebAPI:1"
 _API_ENDPOINT = "{baseURL}/{libspec}"
@@ -78,21 +85,218 @@ _API_SET_VOLUME = {
     "method": "setAudioVolume",
     "version": "1.1"
 }
+_API_GET_SOUND_SETTINGS = {
+    "libspec": "audio",
+    "method": "getSoundSettings",
+    "version": "1.1"
+}
+_API_SET_SOUND_SETTINGS = {
+    "libspec": "audio",
+    "method": "setSoundSettings",
+    "version": "1.1"
+}
+_API_GET_SPEAKER_SETTINGS = {
+    "libspec": "audio",
+    "method": "getSpeakerSettings",
+    "version": "1.0"
+}
+
+# Traffic recording file format identifier (first line of a recording)
+_TRAFFIC_FORMAT = "sonyapi-traffic"
+_TRAFFIC_VERSION = 1
+
+# transport class for live traffic to devices over the network
+class httpTransport(object):
+    """Transport for live HTTP and SSDP traffic to devices (the default transport)."""
+
+    # POST JSON-RPC data to the API endpoint
+    def post(self, url, data, timeout):
+        return requests.post(url, data=data, timeout=timeout)
+
+    # GET a document (e.g. device descriptor XML) from the device
+    def get(self, url, timeout=None):
+        return requests.get(url, timeout=timeout)
+
+    # search for devices using the SSDP M-SEARCH method
+    def search(self, target, timeout):
+        import ssdp
+        return ssdp.discover(target, timeout=timeout)
+
+# transport class that records traffic passing through another transport
+class trafficRecorder(object):
+    """Transport that captures API, descriptor, and SSDP exchanges to a recording file.
+
+    Parameters:
+    filename -- path of the recording file (gzip compressed JSON lines)
+    transport -- transport to pass the traffic through (defaults to live HTTP/SSDP)
+    """
+
+    def __init__(self, filename, transport=None):
+
+        import gzip
+
+        self._transport = httpTransport() if transport is None else transport
+        self._lock = threading.Lock()
+        self._file = gzip.open(filename, "wt", encoding="utf-8")
+        self._write({"format": _TRAFFIC_FORMAT, "version": _TRAFFIC_VERSION, "created": time.time()})
+
+    # write a single record to the recording file
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    # record a HTTP exchange (response or exception) made through the wrapped transport
+    def _record_http(self, kind, url, data, call):
+
+        record = {"k": kind, "url": url}
+        if data is not None:
+            record["req"] = data
+
+        start = time.time()
+        try:
+            response = call()
+        except requests.exceptions.RequestException as e:
+            record.update({"ms": round((time.time() - start) * 1000, 1), "err": type(e).__name__, "msg": str(e)})
+            self._write(record)
+            raise
+
+        record.update({"ms": round((time.time() - start) * 1000, 1), "status": response.status_code, "body": response.text})
+        self._write(record)
+        return response
+
+    def post(self, url, data, timeout):
+        return self._record_http("post", url, data, lambda: self._transport.post(url, data, timeout))
+
+    def get(self, url, timeout=None):
+        return self._record_http("get", url, None, lambda: self._transport.get(url, timeout))
+
+    def search(self, target, timeout):
+
+        start = time.time()
+        responses = self._transport.search(target, timeout)
+        self._write({
+            "k": "ssdp",
+            "st": target,
+            "ms": round((time.time() - start) * 1000, 1),
+            "res": [{"location": r.location, "usn": r.usn, "st": r.st, "cache": r.cache} for r in responses]
+        })
+        return responses
+
+    # flush and close the recording file
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+# transport class that serves previously recorded traffic
+class replayTransport(object):
+    """Transport that serves exchanges from a recording file made by trafficRecorder.
+
+    Exchanges are matched on type, URL, and request data and served in recorded order,
+    cycling back to the first matching exchange when the recording is exhausted.
+
+    Parameters:
+    filename -- path of the recording file
+    speed -- replay speed relative to the recorded latencies (1.0 = original timing, 0 = no delays)
+    """
+
+    def __init__(self, filename, speed=1.0):
+
+        self._speed = speed
+        self._lock = threading.Lock()
+        self._exchanges = {}
+        self._positions = {}
+
+        import gzip
+
+        with gzip.open(filename, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("format") != _TRAFFIC_FORMAT or header.get("version") != _TRAFFIC_VERSION:
+                raise ValueError("Unsupported traffic recording: %s" % filename)
+
+            for line in f:
+                record = json.loads(line)
+                self._exchanges.setdefault(self._key(record), []).append(record)
+
+    # build the lookup key for a recorded exchange
+    @staticmethod
+    def _key(record):
+        if record["k"] == "ssdp":
+            return ("ssdp", record["st"])
+        else:
+            return (record["k"], record["url"], record.get("req"))
+
+    # return the next recorded exchange for the key, delayed to simulate the recorded latency
+    def _next(self, key):
+
+        with self._lock:
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                raise LookupError("No recorded exchange for %s" % str(key))
+            pos = self._positions.get(key, 0)
+            self._positions[key] = (pos + 1) % len(exchanges)
+
+        record = exchanges[pos]
+        if self._speed > 0:
+            time.sleep(record["ms"] / 1000 / self._speed)
+
+        return record
+
+    # convert a recorded HTTP exchange back into a response (or raise the recorded exception)
+    def _response(self, record):
+
+        if "err" in record:
+            exception = getattr(requests.exceptions, record["err"], requests.exceptions.RequestException)
+            raise exception(record["msg"])
+
+        response = requests.models.Response()
+        response.url = record["url"]
+        response.status_code = record["status"]
+        response.encoding = "utf-8"
+        response._content = record["body"].encode("utf-8")
+        return response
+
+    def post(self, url, data, timeout):
+        return self._response(self._next(("post", url, data)))
+
+    def get(self, url, timeout=None):
+        return self._response(self._next(("get", url, None)))
+
+    def search(self, target, timeout):
+        return [SimpleNamespace(**r) for r in self._next(("ssdp", target))["res"]]
+
+# module-wide default transport
+_DEFAULT_TRANSPORT = httpTransport()
+
+# set the default transport used by deviceAPI instances and discover_devices
+def set_default_transport(transport=None):
+    """Sets the transport used when none is specified (e.g. to record or replay traffic)
+
+    Parameters:
+    transport -- transport to use (None restores live network traffic)
+    """
+    global _DEFAULT_TRANSPORT
+    _DEFAULT_TRANSPORT = httpTransport() if transport is None else transport
 
 # interface class
 class deviceAPI(object):
 
     # Primary constructor method
-    def __init__(self, apiURL, apiVer, logger=_LOGGER):
+    def __init__(self, apiURL, apiVer, logger=_LOGGER, transport=None):
 
         # Declare instance variables
         self._apiBase = apiURL
         self._apiVer = apiVer
          
         self._logger = logger
+        self._transport = _DEFAULT_TRANSPORT if transport is None else transport
+
+        # API call statistics (round trip times of recent calls, failure count, and time of last response)
+        self._rttSamples = collections.deque(maxlen=_RTT_SAMPLE_COUNT)
+        self.consecutiveFailures = 0
+        self.lastResponse = 0.0
 
-    # Call the specified API
-    def _call_api(self, api, parms=[]):
+    # Call the specified API (fresh is for interfaces that cache device state - calls always go to the device here)
+    def _call_api(self, api, parms=[], fresh=False):
 
         self._logger.debug("in _call_api() for method %s...", api["method"])
 
@@ -107,25 +311,32 @@ class deviceAPI(object):
         self._logger.debug("HTTP POST URL: %s", _API_ENDPOINT.format(baseURL = self._apiBase, libspec = api["libspec"]))
         self._logger.debug("HTTP POST Data: %s", payload)
 
+        start = time.time()
         try:
-            response = requests.post(
+            response = self._transport.post(
                 _API_ENDPOINT.format(
                     baseURL = self._apiBase,
                     libspec = api["libspec"]
                 ),
-                data=json.dumps(payload),
-                timeout=_HTTP_POST_TIMEOUT
+                json.dumps(payload),
+                _HTTP_POST_TIMEOUT
             )
             response.raise_for_status()    # Raise HTTP errors to be handled in exception handling
 
         # Allow timeout and connection errors to be ignored - log and return false
         except (requests.exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.HTTPError) as e:
             self._logger.warning("HTTP POST in _call_api() failed: %s", str(e))
+            self.consecutiveFailures += 1
             return False
         except:
             self._logger.error("Unexpected error occured: %s", sys.exc_info()[0])
             raise
 
+        # update the call statistics
+        self.lastResponse = time.time()
+        self._rttSamples.append(self.lastResponse - start)
+        self.consecutiveFailures = 0
+
         # parse response JSON
         respData = response.json()
        
@@ -143,6 +354,17 @@ class deviceAPI(object):
         else:
             return True
 
+    # Changes the base URL for the API (e.g. after the device address changed)
+    def setBaseURL(self, apiURL):
+        """Sets the base URL of the API for the device."""
+        self._apiBase = apiURL
+
+    # Returns the rolling average round trip time of API calls
+    def averageRoundTrip(self):
+        """Returns the average round trip time (in seconds) of recent successful API calls (0 if none)."""
+        samples = list(self._rttSamples)
+        return sum(samples) / len(samples) if samples else 0.0
+
     # Gets current power status of receiver
     def getSystemInformation(self):
         """Gets the MAC address of the device."""
@@ -154,32 +376,42 @@ class deviceAPI(object):
         return self._call_api(_API_GET_INTERFACE_INFO)
 
     # Gets current power status of receiver
-    def getPowerStatus(self):
-        """Gets the current power status of the device."""
-        return self._call_api(_API_GET_POWER_STATUS)
+    def getPowerStatus(self, fresh=False):
+        """Gets the current power status of the device.
+
+        Parameters:
+        fresh -- query the device even if the interface has cached state (e.g. a broker snapshot)
+        """
+        return self._call_api(_API_GET_POWER_STATUS, fresh=fresh)
 
     # Gets active status of each zone and input
-    def getCurrentExternalTerminalsStatus(self):
-        """Gets information about the current status of all external input and output terminal sources of the device."""
-        return self._call_api(_API_GET_TERMINAL_STATUS)
+    def getCurrentExternalTerminalsStatus(self, fresh=False):
+        """Gets information about the current status of all external input and output terminal sources of the device.
+
+        Parameters:
+        fresh -- query the device even if the interface has cached state (e.g. a broker snapshot)
+        """
+        return self._call_api(_API_GET_TERMINAL_STATUS, fresh=fresh)
         
     # Gets info of content (source) currently playing on zone
-    def getPlayingContentInfo(self, output=""):
+    def getPlayingContentInfo(self, output="", fresh=False):
         """Gets information about the playing content or current selected input.
 
         Parameters:
         output -- The URI of the output. Use "" to return info for all outputs for the device. 
+        fresh -- query the device even if the interface has cached state (e.g. a broker snapshot)
         """
-        return self._call_api(_API_GET_PLAYING_CONTENT_INFO, [{"output":output}])
+        return self._call_api(_API_GET_PLAYING_CONTENT_INFO, [{"output":output}], fresh)
 
     # Gets current volume level for zone
-    def getVolumeInformation(self, output=""):
+    def getVolumeInformation(self, output="", fresh=False):
         """Gets the current volume level and mute status.
 
         Parameters:
         output -- The URI of the output. Use "" to return info for all outputs for the device. 
+        fresh -- query the device even if the interface has cached state (e.g. a broker snapshot)
         """
-        return self._call_api(_API_GET_VOLUME_INFO, [{"output":output}])
+        return self._call_api(_API_GET_VOLUME_INFO, [{"output":output}], fresh)
 
     # Changes the power status of the receiver
     def setPowerStatus(self, status):
@@ -230,30 +462,97 @@ class deviceAPI(object):
         """
         return self._call_api(_API_SET_MUTE, [{"output":output, "mute":mute}])
 
+    # Gets the sound settings of the device
+    def getSoundSettings(self, target=""):
+        """Gets the current sound settings (e.g. soundField, nightMode, pureDirect).
+
+        Parameters:
+        target -- The name of the setting. Use "" to return all sound settings for the device.
+        """
+        return self._call_api(_API_GET_SOUND_SETTINGS, [{"target":target}])
+
+    # Changes one or more sound settings of the device
+    def setSoundSettings(self, settings):
+        """Sets one or more sound settings in a single call.
+
+        Parameters:
+        settings -- Dictionary of setting names and values to set (e.g. {"nightMode": "on"})
+        """
+        return self._call_api(_API_SET_SOUND_SETTINGS, [{"settings":[{"target":target, "value":value} for target, value in settings.items()]}])
+
+    # Gets the speaker settings of the device
+    def getSpeakerSettings(self, target=""):
+        """Gets the current speaker settings (e.g. subwooferLevel, centerLevel).
+
+        Parameters:
+        target -- The name of the setting. Use "" to return all speaker settings for the device.
+        """
+        return self._call_api(_API_GET_SPEAKER_SETTINGS, [{"target":target}])
+
+# XML namespaces from the Sony STR-DN1070 device descriptor XML file
+# Note: hopefully all Sony devices use the same namespaces
+_DESCRIPTOR_NS = {
+    "upnp": "urn:schemas-upnp-org:device-1-0",
+    "av": "urn:schemas-sony-com:av",
+    "dlna": "urn:schemas-dlna-org:device-1-0",
+    "pnpx": "http://schemas.microsoft.com/windows/pnpx/2005/11",
+    "df": "http://schemas.microsoft.com/windows/2008/09/devicefoundation",
+    "ms": "urn:schemas-microsoft-com:WMPNSS-1-0"
+} 
+
+# extract the device info from the parsed device descriptor XML
+def _parse_descriptor(root, logger):
+
+    ns = _DESCRIPTOR_NS
+
+    # extract the Sony Audio Control API DeviceInfo node from the XML
+    apiNode = root.find(".//av:X_ScalarWebAPI_DeviceInfo", ns)
+
+    # if the DeviceInfo node for the Sony Audio Control API was found, make sure
+    # the device supports all of the required services
+    if apiNode is not None:
+
+        # extract the supported services from the DeviceInfo nodes
+        services = []
+        for serviceType in apiNode.find("av:X_ScalarWebAPI_ServiceList", ns).findall("av:X_ScalarWebAPI_ServiceType", ns):
+            services.append(serviceType.text)
+
+        # check for system, audio, and avContent service support
+        if all(s in services for s in ("system", "audio", "avContent")):
+        
+            # extract the elements we need from the XML string
+            udn = root.find(".//upnp:UDN", ns).text
+            id = udn[-6:] # the last 6 digits of the "node" from the uuid (hex)
+            name = root.find(".//upnp:friendlyName", ns).text
+            model = root.find(".//upnp:modelName", ns).text
+            apiVer = apiNode.find("av:X_ScalarWebAPI_Version", ns).text
+            apiURL = apiNode.find("av:X_ScalarWebAPI_BaseURL", ns).text
+    
+            logger.debug("Sony Audio Control API device found in discover - ID: %s, Name: %s, Model: %s", id, name, model)
+
+            return {"id": id, "udn": udn, "name": name, "model": model, "apiVer": apiVer, "apiURL": apiURL}
+
+    return None
+
 # discover devices 
-def discover_devices(timeout=5, logger=_LOGGER):
+def discover_devices(timeout=5, logger=_LOGGER, transport=None):
     """Discover devices supporting Sony Audio Control API using SSDP
         
     Parameters:
     timeout -- timeout for SSDP broadcast (defaults to 5)
     logger -- logger to use for errors (defaults to root logger)
+    transport -- transport for SSDP and HTTP traffic (defaults to live network)
     """
     
-    devices = []
+    import xml.etree.ElementTree as ET
+
+    if transport is None:
+        transport = _DEFAULT_TRANSPORT
 
-    # XML namespaces from the Sony STR-DN1070 device descriptor XML file
-    # Note: hopefully all Sony devices use the same namespaces
-    ns = {
-        "upnp": "urn:schemas-upnp-org:device-1-0",
-        "av": "urn:schemas-sony-com:av",
-        "dlna": "urn:schemas-dlna-org:device-1-0",
-        "pnpx": "http://schemas.microsoft.com/windows/pnpx/2005/11",
-        "df": "http://schemas.microsoft.com/windows/2008/09/devicefoundation",
-        "ms": "urn:schemas-microsoft-com:WMPNSS-1-0"
-    } 
+    devices = []
 
     # discover devices via the SSDP M-SEARCH method
-    responses = ssdp.discover(_SSDP_SEARCH_TARGET, timeout=timeout)
+    responses = transport.search(_SSDP_SEARCH_TARGET, timeout)
 
     logger.debug("SSDP discovery returned %i devices.", len(responses))
 
@@ -262,7 +561,7 @@ def discover_devices(timeout=5, logger=_LOGGER):
 
         # Retrieve the XML from the specified URL
         try:
-            response = requests.get(response.location)   
+            response = transport.get(response.location)   
     
             # uncomment the next line to dump response XML to log file for debugging
             logger.debug("XML Response from discoverd device: %s", response.text)
@@ -276,33 +575,287 @@ def discover_devices(timeout=5, logger=_LOGGER):
             logger.error("Unexpected error occurred retrieving device info: %s", sys.exc_info()[0])
             raise
         
-        # extract the Sony Audio Control API DeviceInfo node from the XML
-        apiNode = root.find(".//av:X_ScalarWebAPI_DeviceInfo", ns)
+        # append supported devices to device list
+        device = _parse_descriptor(root, logger)
+        if device is not None:
+            devices.append(device)
 
-        # if the DeviceInfo node for the Sony Audio Control API was found, make sure
-        # the device supports all of the required services
-        if apiNode is not None:
+    return devices
 
-            # extract the supported services from the DeviceInfo nodes
-            services = []
-            for serviceType in apiNode.find("av:X_ScalarWebAPI_ServiceList", ns).findall("av:X_ScalarWebAPI_ServiceType", ns):
-                services.append(serviceType.text)
+# locate a specific device 
+def locate_device(udn, timeout=3, logger=_LOGGER, transport=None):
+    """Locate a previously discovered device by its UDN using SSDP (e.g. after its IP address changed)
 
-            # check for system, audio, and avContent service support
-            if all(s in services for s in ("system", "audio", "avContent")):
-            
-                # extract the elements we need from the XML string
-                id = root.find(".//upnp:UDN", ns).text[-6:] # the last 6 digits of the "node" from the uuid (hex)
-                name = root.find(".//upnp:friendlyName", ns).text
-                model = root.find(".//upnp:modelName", ns).text
-                apiVer = apiNode.find("av:X_ScalarWebAPI_Version", ns).text
-                apiURL = apiNode.find("av:X_ScalarWebAPI_BaseURL", ns).text
-        
-                logger.debug("Sony Audio Control API device found in discover - ID: %s, Name: %s, Model: %s", id, name, model)
+    Parameters:
+    udn -- UDN of the device ("uuid:..."), or the trailing digits of the UDN (e.g. the device ID)
+    timeout -- timeout for SSDP broadcast (defaults to 3)
+    logger -- logger to use for errors (defaults to root logger)
+    transport -- transport for SSDP and HTTP traffic (defaults to live network)
 
-                # append to device list
-                devices.append({"id": id, "name": name, "model": model, "apiVer": apiVer, "apiURL": apiURL})
+    Returns the device info for the device, or None if the device was not found
+    """
 
-    return devices
+    import xml.etree.ElementTree as ET
+
+    if transport is None:
+        transport = _DEFAULT_TRANSPORT
+
+    # search for API devices and keep only the response whose USN is for the device
+    for response in transport.search(_SSDP_SEARCH_TARGET, timeout):
+
+        if response.usn and response.usn.split("::")[0].lower().endswith(udn.lower()):
+
+            logger.debug("SSDP search located device %s at %s.", udn, response.location)
+
+            # Retrieve and parse the device descriptor XML - the device may have gone
+            # away again, so log and return None on errors
+            try:
+                response = transport.get(response.location, timeout)
+                root = ET.fromstring(response.text)
+            except Exception as e:
+                logger.warning("Error retrieving device info in locate_device(): %s", str(e))
+                return None
+
+            return _parse_descriptor(root, logger)
+
+    logger.debug("SSDP search did not locate device %s.", udn)
+    return None
+
+# Load generator operations - each is called with the deviceAPI object and a zone state dictionary.
+# The set operations re-send the zone's current state (captured at start) so they don't change the device.
+_LOAD_OPERATIONS = {
+    "getSystemInformation": lambda api, zone: api.getSystemInformation(),
+    "getInterfaceInformation": lambda api, zone: api.getInterfaceInformation(),
+    "getPowerStatus": lambda api, zone: api.getPowerStatus(),
+    "getCurrentExternalTerminalsStatus": lambda api, zone: api.getCurrentExternalTerminalsStatus(),
+    "getPlayingContentInfo": lambda api, zone: api.getPlayingContentInfo(zone["uri"]),
+    "getVolumeInformation": lambda api, zone: api.getVolumeInformation(zone["uri"]),
+    "setActiveTerminal": lambda api, zone: api.setActiveTerminal(zone["uri"], zone["active"]),
+    "setPlayContent": lambda api, zone: api.setPlayContent(zone["uri"], zone["source"]),
+    "setAudioVolume": lambda api, zone: api.setAudioVolume(zone["uri"], str(zone["volume"])),
+    "setAudioMute": lambda api, zone: api.setAudioMute(zone["uri"], zone["mute"])
+}
+_LOAD_DEFAULT_MIX = "getPowerStatus=1,getCurrentExternalTerminalsStatus=1,getVolumeInformation=1,getPlayingContentInfo=1"
+
+# parse an operation mix string ("method=weight,method=weight,...") into a dictionary
+def _parse_mix(mix):
+
+    weights = {}
+    for item in mix.split(","):
+        method, _, weight = item.strip().partition("=")
+        if method not in _LOAD_OPERATIONS:
+            raise ValueError("Unsupported method in mix: %s" % method)
+        weights[method] = float(weight) if weight else 1.0
+
+    return weights
+
+# capture the current state of each zone of a device for use by the load operations
+def _capture_zones(api):
+
+    # treat a device whose state can't be read (e.g. exchanges missing from a replayed recording) as having no zones
+    try:
+        terminals = api.getCurrentExternalTerminalsStatus()
+        volumeInfo = api.getVolumeInformation()
+        sourceInfo = api.getPlayingContentInfo()
+    except LookupError as e:
+        _LOGGER.warning("Unable to capture zone state for %s: %s", api._apiBase, repr(e))
+        return []
+
+    if not (terminals and volumeInfo and sourceInfo):
+        return []
+
+    zones = []
+    for terminal in terminals:
+        if terminal["meta"] == "meta:zone:output":
+            uri = terminal["uri"]
+            source = next((item for item in sourceInfo if item["output"] == uri), {})
+            volume = next((item for item in volumeInfo if item["output"] == uri), {})
+            zones.append({
+                "uri": uri,
+                "active": terminal["active"],
+                "source": source.get("uri", ""),
+                "volume": volume.get("volume", 0),
+                "mute": volume.get("mute", "off")
+            })
+
+    return zones
+
+# return the percentile (nearest rank) of a sorted list of values
+def _percentile(values, pct):
+    """
+    >>> values = list(range(1, 101))
+    >>> _percentile(values, 50), _percentile(values, 95), _percentile(values, 99), _percentile(values, 100)
+    (50, 95, 99, 100)
+    >>> _percentile(list(range(1, 21)), 95), _percentile(list(range(1, 11)), 50), _percentile([7], 0)
+    (19, 5, 7)
+    """
 
-    
+    if not values:
+        return 0.0
+
+    # multiply before dividing so that exact ranks are not rounded up by floating point error
+    rank = max(math.ceil(pct * len(values) / 100) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+# summarize a list of (latency, success) samples
+def _summarize(samples, elapsed):
+
+    latencies = sorted(s[0] * 1000 for s in samples)
+    return {
+        "calls": len(samples),
+        "errors": sum(1 for s in samples if not s[1]),
+        "throughput": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50": round(_percentile(latencies, 50), 1),
+        "p95": round(_percentile(latencies, 95), 1),
+        "p99": round(_percentile(latencies, 99), 1),
+        "max": round(latencies[-1], 1) if latencies else 0.0
+    }
+
+# run a load test against the devices and return the report dictionary
+def run_load(targets, mix, concurrency=1, rate=0, calls=100, duration=None):
+    """Runs a mix of API calls against one or more devices and reports latency per method
+
+    Parameters:
+    targets -- list of (deviceAPI, zones) tuples for the devices to call
+    mix -- dictionary of method names and relative weights
+    concurrency -- number of concurrent workers (defaults to 1)
+    rate -- overall call rate limit in calls per second (0 for unlimited)
+    calls -- total number of calls to make (ignored if duration is specified)
+    duration -- length of time in seconds to run
+    """
+
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    methods = list(mix.keys())
+    weights = list(mix.values())
+    samples = {method: [] for method in methods}
+    lock = threading.Lock()
+    schedule = {"next": time.time(), "issued": 0}
+
+    start = time.time()
+    deadline = start + duration if duration else None
+
+    # claim the next call slot, honoring the rate limit - returns False when the run is complete
+    def claim():
+        with lock:
+            now = time.time()
+            if (deadline and now >= deadline) or (not deadline and schedule["issued"] >= calls):
+                return False
+            schedule["issued"] += 1
+            slot = max(now, schedule["next"])
+            if rate > 0:
+                schedule["next"] = slot + 1 / rate
+        if slot > now:
+            time.sleep(slot - now)
+        return True
+
+    def worker():
+        while claim():
+            api, zones = random.choice(targets)
+            method = random.choices(methods, weights)[0]
+            zone = random.choice(zones) if zones else {"uri": "", "active": "active", "source": "", "volume": 0, "mute": "off"}
+            callStart = time.time()
+
+            # count unexpected errors (e.g. an exchange missing from a replayed recording) as failed calls
+            try:
+                result = _LOAD_OPERATIONS[method](api, zone)
+            except Exception as e:
+                _LOGGER.debug("Load operation %s raised %s", method, repr(e))
+                result = False
+            latency = time.time() - callStart
+            with lock:
+                samples[method].append((latency, result is not False))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+
+    elapsed = time.time() - start
+
+    return {
+        "started": start,
+        "elapsed": round(elapsed, 3),
+        "concurrency": concurrency,
+        "rate": rate,
+        "targets": [api._apiBase for api, zones in targets],
+        "methods": {method: _summarize(samples[method], elapsed) for method in methods if samples[method]},
+        "total": _summarize([s for method in methods for s in samples[method]], elapsed)
+    }
+
+# format the load test report as a text table
+def _format_report(report):
+
+    lines = [
+        "Targets: %s" % ", ".join(report["targets"]),
+        "Elapsed: %.3f s, concurrency: %i, rate limit: %s" % (report["elapsed"], report["concurrency"], report["rate"] or "none"),
+        "",
+        "%-36s %7s %7s %9s %9s %9s %9s %9s" % ("method", "calls", "errors", "calls/s", "p50 ms", "p95 ms", "p99 ms", "max ms")
+    ]
+    rows = sorted(report["methods"].items()) + [("TOTAL", report["total"])]
+    for method, stats in rows:
+        lines.append("%-36s %7i %7i %9.2f %9.1f %9.1f %9.1f %9.1f" % (
+            method, stats["calls"], stats["errors"], stats["throughput"], stats["p50"], stats["p95"], stats["p99"], stats["max"]
+        ))
+
+    return "\n".join(lines)
+
+# Command line load generator and latency reporter
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load generator and latency reporter for Sony Audio Control API devices.")
+    parser.add_argument("targets", nargs="*", metavar="URL", help="API base URL of a device (e.g. http://192.168.1.20:10000/sony) - discovers devices if omitted")
+    parser.add_argument("-m", "--mix", default=_LOAD_DEFAULT_MIX, help="weighted method mix as method=weight,... (default: %(default)s)")
+    parser.add_argument("-c", "--concurrency", type=int, default=1, help="number of concurrent workers (default: %(default)s)")
+    parser.add_argument("-r", "--rate", type=float, default=0, help="overall rate limit in calls per second, 0 for unlimited (default: %(default)s)")
+    parser.add_argument("-n", "--requests", type=int, default=100, help="total number of calls (default: %(default)s)")
+    parser.add_argument("-d", "--duration", type=float, help="run for a number of seconds instead of a number of calls")
+    parser.add_argument("-j", "--json", metavar="FILE", help="write the report as JSON to FILE (- for stdout)")
+    parser.add_argument("--record", metavar="FILE", help="record the device traffic to FILE")
+    parser.add_argument("--replay", metavar="FILE", help="replay device traffic from FILE instead of the network")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed relative to the recorded timing, 0 for no delays (default: %(default)s)")
+    parser.add_argument("--timeout", type=int, default=5, help="SSDP discovery timeout in seconds (default: %(default)s)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log API calls and responses")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s')
+    _LOGGER.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+
+    try:
+        mix = _parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.record and args.replay:
+        parser.error("--record and --replay can't be used together")
+
+    # setup the transport for recording or replaying the traffic
+    if args.replay:
+        set_default_transport(replayTransport(args.replay, args.speed))
+    elif args.record:
+        set_default_transport(trafficRecorder(args.record))
+
+    # target the specified devices or discover devices on the network
+    urls = args.targets or [dev["apiURL"] for dev in discover_devices(args.timeout)]
+    if not urls:
+        sys.exit("No Sony Audio Control API devices found.")
+
+    targets = []
+    for url in urls:
+        api = deviceAPI(url, "")
+        targets.append((api, _capture_zones(api)))
+
+    report = run_load(targets, mix, args.concurrency, args.rate, args.requests, args.duration)
+
+    if isinstance(_DEFAULT_TRANSPORT, trafficRecorder):
+        _DEFAULT_TRANSPORT.close()
+
+    print(_format_report(report))
+
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
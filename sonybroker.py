@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+"""
+Shared status broker for Sony Audio Control API devices - polls each device once on behalf of
+multiple nodeserver instances, which subscribe to state snapshots and send commands over a Unix socket
+by Goose66 (W. Randy King) kingwrandy@gmail.com
+"""
+
+import os
+import sys
+import stat
+import time
+import json
+import socket
+import socketserver
+import threading
+import logging
+import sonyapi
+from concurrent.futures import ThreadPoolExecutor
+
+_LOGGER = logging.getLogger()
+
+# Default location of the broker socket
+_DEFAULT_SOCKET = "/tmp/sonyavr-broker.sock"
+
+# Timeout for a call forwarded through the broker (seconds) - longer than the HTTP timeout in sonyapi
+_BROKER_CALL_TIMEOUT = 10
+
+# Interval between attempts to reconnect to the broker (seconds) - calls go directly to the device in between
+_BROKER_RECONNECT_INTERVAL = 30
+
+# Number of threads for running forwarded calls in the broker
+_BROKER_CALL_THREADS = 8
+
+# The calls made by the broker poll (and answered from the state snapshots)
+_POLL_CALLS = [
+    ("getPowerStatus", lambda api: api.getPowerStatus()),
+    ("getCurrentExternalTerminalsStatus", lambda api: api.getCurrentExternalTerminalsStatus()),
+    ("getVolumeInformation", lambda api: api.getVolumeInformation()),
+    ("getPlayingContentInfo", lambda api: api.getPlayingContentInfo())
+]
+_POLL_PARAMS = {
+    "getPowerStatus": [],
+    "getCurrentExternalTerminalsStatus": [],
+    "getVolumeInformation": [{"output": ""}],
+    "getPlayingContentInfo": [{"output": ""}]
+}
+
+# Fields required in the messages from nodeserver instances
+_MESSAGE_FIELDS = {
+    "subscribe": ("url",),
+    "unsubscribe": ("url",),
+    "call": ("id", "url", "api", "params")
+}
+_API_FIELDS = ("method", "version", "libspec")
+
+# check that a message from a nodeserver instance has the fields required for its operation
+def _valid_message(message):
+
+    if not isinstance(message, dict) or message.get("op") not in _MESSAGE_FIELDS:
+        return False
+    if any(field not in message for field in _MESSAGE_FIELDS[message["op"]]):
+        return False
+    if message["op"] == "call":
+        api = message["api"]
+        return isinstance(api, dict) and all(field in api for field in _API_FIELDS) and isinstance(message["params"], list)
+    return True
+
+# build the key for a call in a state snapshot
+def _snapshot_key(method, params):
+    return method + json.dumps(params, sort_keys=True)
+
+# send a message on a socket as a line of JSON
+def _send(sock, lock, message):
+    data = (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+    with lock:
+        sock.sendall(data)
+
+# state of a device polled by the broker
+class _brokerDevice(object):
+
+    def __init__(self, server, apiURL, apiVer):
+
+        self.apiURL = apiURL
+        self.api = sonyapi.deviceAPI(apiURL, apiVer, _LOGGER)
+        self.subscribers = {}   # connection handler: poll interval
+        self.snapshot = None
+        self._server = server
+        self._wake = threading.Event()
+        self._thread = None
+
+    # start the poll thread for the device if it isn't running
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._poll_loop, daemon=True)
+            self._thread.start()
+
+    # poll the device early (e.g. after a command changed its state)
+    def wake(self):
+        self._wake.set()
+
+    # poll the device at the shortest interval of its subscribers while it has subscribers
+    def _poll_loop(self):
+
+        _LOGGER.info("Started polling device at %s.", self.apiURL)
+
+        while True:
+
+            with self._server.lock:
+                if not self.subscribers:
+                    break
+                interval = min(self.subscribers.values())
+
+            self.snapshot = self.poll()
+            self._server.publish(self)
+
+            self._wake.wait(interval)
+            self._wake.clear()
+
+        _LOGGER.info("Stopped polling device at %s - no subscribers.", self.apiURL)
+
+    # poll the device and return the state snapshot
+    def poll(self):
+
+        data = {}
+        for method, call in _POLL_CALLS:
+            result = call(self.api)
+            data[_snapshot_key(method, _POLL_PARAMS[method])] = result
+
+            # no need to continue if the device is not responding
+            if not result:
+                break
+
+        return {
+            "op": "snapshot",
+            "url": self.apiURL,
+            "time": time.time(),
+            "failures": self.api.consecutiveFailures,
+            "rtt": self.api.averageRoundTrip(),
+            "data": data
+        }
+
+# connection handler for a nodeserver instance
+class _brokerHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super(_brokerHandler, self).setup()
+        self.sendLock = threading.Lock()
+
+    # send a message to the nodeserver instance, ignoring closed connections
+    def send(self, message):
+        try:
+            _send(self.request, self.sendLock, message)
+        except OSError:
+            pass
+
+    def handle(self):
+
+        _LOGGER.info("Nodeserver instance connected.")
+
+        for line in self.rfile:
+
+            try:
+                message = json.loads(line)
+            except ValueError:
+                _LOGGER.warning("Invalid message from nodeserver instance: %s", line)
+                continue
+
+            if not _valid_message(message):
+                _LOGGER.warning("Invalid message from nodeserver instance: %s", line)
+                continue
+
+            if message["op"] == "subscribe":
+                self.server.subscribe(self, message)
+            elif message["op"] == "unsubscribe":
+                self.server.unsubscribe(self, message["url"])
+            elif message["op"] == "call":
+                self.server.executor.submit(self.server.call, self, message)
+
+    def finish(self):
+        self.server.unsubscribe(self)
+        super(_brokerHandler, self).finish()
+        _LOGGER.info("Nodeserver instance disconnected.")
+
+# broker server
+class brokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server that polls devices for subscribed nodeserver instances and forwards their calls.
+
+    Parameters:
+    path -- path of the Unix socket
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path):
+
+        # remove a stale socket left by a previous broker, but not the socket of a running broker
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+            except ConnectionRefusedError:
+                os.remove(path)
+            else:
+                raise OSError("A broker is already listening on %s" % path)
+            finally:
+                sock.close()
+
+        super(brokerServer, self).__init__(path, _brokerHandler)
+        self.lock = threading.Lock()
+        self.devices = {}
+        self.executor = ThreadPoolExecutor(max_workers=_BROKER_CALL_THREADS)
+
+    # subscribe a nodeserver instance to the state snapshots of a device
+    def subscribe(self, handler, message):
+
+        url = message["url"]
+        with self.lock:
+
+            # a nodeserver instance only subscribes to one URL for a device (e.g. after an address change)
+            if message.get("previous"):
+                self._remove(handler, message["previous"])
+
+            device = self.devices.get(url)
+            if device is None:
+                device = _brokerDevice(self, url, message.get("ver", ""))
+                self.devices[url] = device
+            device.subscribers[handler] = message.get("interval", 20)
+            snapshot = device.snapshot
+
+        _LOGGER.debug("Nodeserver instance subscribed to device at %s.", url)
+
+        # send the current snapshot right away, and start polling if not already polling
+        if snapshot is not None:
+            handler.send(snapshot)
+        device.start()
+
+    # unsubscribe a nodeserver instance from a device (or all devices)
+    def unsubscribe(self, handler, url=None):
+
+        with self.lock:
+            for deviceURL in ([url] if url else list(self.devices)):
+                self._remove(handler, deviceURL)
+
+    # remove a subscriber from a device and forget devices without subscribers (must hold lock)
+    def _remove(self, handler, url):
+
+        device = self.devices.get(url)
+        if device is not None:
+            device.subscribers.pop(handler, None)
+            if not device.subscribers:
+                del self.devices[url]
+                device.wake()
+
+    # send a device's state snapshot to its subscribers
+    def publish(self, device):
+
+        with self.lock:
+            handlers = list(device.subscribers)
+
+        for handler in handlers:
+            handler.send(device.snapshot)
+
+    # run a call forwarded by a nodeserver instance and send the result
+    def call(self, handler, message):
+
+        with self.lock:
+            device = self.devices.get(message["url"])
+
+        # calls for devices without subscribers use a temporary interface
+        api = device.api if device is not None else sonyapi.deviceAPI(message["url"], "", _LOGGER)
+
+        try:
+            result = api._call_api(message["api"], message["params"])
+        except Exception as e:
+            _LOGGER.error("Unexpected error in forwarded call %s: %s", message["api"]["method"], str(e))
+            result = False
+
+        handler.send({"op": "result", "id": message["id"], "result": result, "failures": api.consecutiveFailures})
+
+        # refresh the snapshot after calls that may change the device state
+        if device is not None and not message["api"]["method"].startswith("get"):
+            device.wake()
+
+# interface class for a device that is accessed through the broker
+class brokerAPI(sonyapi.deviceAPI):
+    """Device interface that answers poll calls from the broker's state snapshots and forwards other calls
+    to the broker. Calls go directly to the device while the broker is unavailable.
+
+    Parameters:
+    socketPath -- path of the broker's Unix socket
+    apiURL -- base URL of the API for the device
+    apiVer -- API version of the device
+    logger -- logger to use
+    interval -- poll interval requested from the broker (seconds)
+    """
+
+    def __init__(self, socketPath, apiURL, apiVer, logger=_LOGGER, interval=20):
+        super(brokerAPI, self).__init__(apiURL, apiVer, logger)
+
+        self._socketPath = socketPath
+        self._interval = interval
+        self._sock = None
+        self._sendLock = threading.Lock()
+        self._lock = threading.Lock()
+        self._nextConnect = 0.0
+        self._nextID = 0
+        self._pending = {}
+        self._snapshot = None
+        self._brokerRTT = 0.0
+
+        self._connect()
+
+    # connect to the broker and subscribe to the device
+    def _connect(self):
+
+        self._nextConnect = time.time() + _BROKER_RECONNECT_INTERVAL
+
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self._socketPath)
+        except OSError as e:
+            self._logger.warning("Unable to connect to broker at %s - calling device directly: %s", self._socketPath, str(e))
+            return False
+
+        self._sock = sock
+        threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+        self._subscribe()
+
+        self._logger.info("Connected to broker at %s for device at %s.", self._socketPath, self._apiBase)
+        return True
+
+    # subscribe to the state snapshots of the device
+    def _subscribe(self, previous=None):
+        self._send({"op": "subscribe", "url": self._apiBase, "ver": self._apiVer, "interval": self._interval, "previous": previous})
+
+    # send a message to the broker, dropping the connection on errors
+    def _send(self, message):
+
+        sock = self._sock
+        if sock is None:
+            return False
+
+        try:
+            _send(sock, self._sendLock, message)
+            return True
+        except OSError as e:
+            self._logger.warning("Lost connection to broker: %s", str(e))
+            self._disconnect(sock)
+            return False
+
+    # drop the connection to the broker and fail any waiting calls
+    def _disconnect(self, sock):
+
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+                self._snapshot = None
+            pending = list(self._pending.values())
+            self._pending.clear()
+
+        for waiter in pending:
+            waiter["event"].set()
+
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    # read snapshots and call results from the broker
+    def _read_loop(self, sock):
+
+        try:
+            for line in sock.makefile("rb"):
+
+                message = json.loads(line)
+
+                if message["op"] == "snapshot" and message["url"] == self._apiBase:
+                    with self._lock:
+                        self._snapshot = message
+                    self.consecutiveFailures = message["failures"]
+                    self._brokerRTT = message["rtt"]
+                    if not message["failures"]:
+                        self.lastResponse = message["time"]
+
+                elif message["op"] == "result":
+                    with self._lock:
+                        waiter = self._pending.pop(message["id"], None)
+                    if waiter is not None:
+                        waiter["message"] = message
+                        waiter["event"].set()
+
+        except (OSError, ValueError) as e:
+            self._logger.warning("Error reading from broker: %s", str(e))
+
+        self._disconnect(sock)
+
+    # Call the specified API, using the broker's state snapshot if it is current (unless a fresh result is required)
+    def _call_api(self, api, parms=[], fresh=False):
+
+        # reconnect to the broker if the connection was lost
+        if self._sock is None and time.time() >= self._nextConnect:
+            self._connect()
+
+        # call the device directly if the broker is not available
+        if self._sock is None:
+            return super(brokerAPI, self)._call_api(api, parms)
+
+        # answer poll calls from the snapshot if it is from the current broker poll cycle
+        # (snapshots are stamped at the end of the broker poll, so a cycle lasts the interval plus the poll time)
+        key = _snapshot_key(api["method"], parms)
+        with self._lock:
+            snapshot = self._snapshot
+        if not fresh and snapshot is not None and key in snapshot["data"] and time.time() - snapshot["time"] <= self._interval + _BROKER_CALL_TIMEOUT:
+            self._logger.debug("Returning %s from broker snapshot.", api["method"])
+            return snapshot["data"][key]
+
+        # forward the call to the broker and wait for the result
+        waiter = {"event": threading.Event(), "message": None}
+        with self._lock:
+            self._nextID += 1
+            callID = self._nextID
+            self._pending[callID] = waiter
+
+        if not self._send({"op": "call", "id": callID, "url": self._apiBase, "api": api, "params": parms}):
+            return super(brokerAPI, self)._call_api(api, parms)
+
+        if not waiter["event"].wait(_BROKER_CALL_TIMEOUT) or waiter["message"] is None:
+            with self._lock:
+                self._pending.pop(callID, None)
+            self._logger.warning("Call to %s through broker failed or timed out.", api["method"])
+            return False
+
+        message = waiter["message"]
+        self.consecutiveFailures = message["failures"]
+        if message["result"] is not False:
+            self.lastResponse = time.time()
+
+        return message["result"]
+
+    # Changes the base URL for the API and moves the subscription to the new URL
+    def setBaseURL(self, apiURL):
+        """Sets the base URL of the API for the device."""
+
+        previous = self._apiBase
+        super(brokerAPI, self).setBaseURL(apiURL)
+        with self._lock:
+            self._snapshot = None
+        self._subscribe(previous)
+
+    # Returns the rolling average round trip time of the device's API calls as measured by the broker
+    def averageRoundTrip(self):
+        """Returns the average round trip time (in seconds) of recent successful API calls (0 if none)."""
+        if self._sock is None:
+            return super(brokerAPI, self).averageRoundTrip()
+        return self._brokerRTT
+
+# Run the broker
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Shared status broker for SonyAVR nodeserver instances.")
+    parser.add_argument("-s", "--socket", default=_DEFAULT_SOCKET, help="path of the Unix socket (default: %(default)s)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log API calls and responses")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s')
+    _LOGGER.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
+    try:
+        server = brokerServer(args.socket)
+    except OSError as e:
+        _LOGGER.error("Unable to start broker: %s", str(e))
+        sys.exit(1)
+
+    _LOGGER.info("SonyAVR broker listening on %s...", args.socket)
+
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        _LOGGER.warning("Received interrupt or exit...")
+    finally:
+        server.server_close()
+        os.remove(args.socket)